@@ -15,8 +15,11 @@ import sys
 
 import tempfile
 import ctypes
+import queue
 import threading
+import time
 import secrets
+from collections import OrderedDict, deque
 
 
 
@@ -64,6 +67,26 @@ except ModuleNotFoundError as exc:
     _show_missing_dependency_error(exc.name)
     raise SystemExit(1) from exc
 
+from reca_data import (
+    EmpresasReplica,
+    FacetCounts,
+    FacetProvider,
+    RealtimeFeed,
+    FuzzyIndex,
+    NitIndex,
+    PrefixIndex,
+    canonical_nit,
+    is_missing_column_error,
+    nit_dv_ok,
+    QueryCache,
+    SearchIndex,
+    load_rows_snapshot,
+    realtime_url,
+    save_rows_snapshot,
+    search_key,
+)
+from reca_repository import Repositories, SupabaseRepository
+
 
 
 # ============================================
@@ -298,6 +321,42 @@ def _get_appdata_dir():
 
     return os.path.join(os.getcwd(), APP_NAME)
 
+def _abrir_replica_empresas(columns):
+    """Abre la replica SQLite de empresas; None si el disco no lo permite."""
+    try:
+        return EmpresasReplica(os.path.join(_get_appdata_dir(), "empresas.sqlite3"), columns)
+    except Exception:
+        LOG.exception("No se pudo abrir la replica local de empresas")
+        return None
+
+# Tablas que resultaron no tener columna id (se decide una vez por proceso)
+_TABLAS_SIN_ID = set()
+
+
+def _listar_ordenado(repo, columns, column):
+    """
+    Todas las filas de `repo` ordenadas por `column`, paginando sobre (column, id).
+
+    `column` puede repetirse (p. ej. nombre), asi que el cursor necesita el id
+    para no saltar filas en el borde de una pagina. Si la tabla no tiene id se
+    pagina por su propia clave (o por `column`), como antes, sin volver a
+    intentar con id.
+    """
+    if repo.table not in _TABLAS_SIN_ID:
+        select = columns if columns == "*" else "id," + columns
+        try:
+            return repo.list(select, order=(column, True), key="id")
+        except Exception as exc:
+            if not is_missing_column_error(exc):
+                raise
+            _TABLAS_SIN_ID.add(repo.table)
+            LOG.warning("%s no tiene columna id; se pagina por su clave", repo.table)
+    key = repo.key if repo.key != "id" else column
+    return repo.list(columns, order=(column, True), key=key)
+
+def _get_snapshot_path():
+    return os.path.join(_get_appdata_dir(), "empresas_snapshot.json.gz")
+
 def _get_log_dir():
     base_dir = os.getenv("LOCALAPPDATA") or os.getenv("APPDATA") or _get_appdata_dir()
     return os.path.join(base_dir, APP_NAME, "logs")
@@ -425,6 +484,92 @@ def _ensure_authenticated(client: Client):
         return False
 
 
+class _SesionSupabase:
+    """
+    Cliente de Supabase unico para todo el proceso.
+
+    Todas las ventanas comparten el mismo cliente (y con el su pool de
+    conexiones HTTP) y el login se hace una sola vez. El token lo renueva el
+    auto_refresh_token del propio cliente; aqui solo se escuchan sus eventos
+    para pasar cada token nuevo a los suscriptores (el websocket de cambios en
+    vivo) y para volver a iniciar sesion si la renovacion falla.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def cliente(self):
+        """Devuelve el cliente autenticado; lo crea e inicia sesion la primera vez."""
+        with self._lock:
+            if self._client is not None:
+                return self._client
+            client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+            if not _ensure_authenticated(client):
+                return None
+            client.auth.on_auth_state_change(self._on_auth_event)
+            self._client = client
+            return client
+
+    def precargar(self):
+        """Inicia sesion en segundo plano; los errores quedan en el log."""
+        if not _ensure_credentials():
+            return
+        try:
+            self.cliente()
+        except Exception:
+            LOG.exception("Error iniciando sesion en Supabase")
+
+    def token(self):
+        client = self._client
+        if client is None:
+            return None
+        try:
+            return getattr(client.auth.get_session(), "access_token", None)
+        except Exception:
+            LOG.exception("Error leyendo la sesion de Supabase")
+            return None
+
+    def suscribir(self, fn):
+        """Registra fn(token) para cada renovacion del token."""
+        with self._lock:
+            self._listeners.append(fn)
+
+    def desuscribir(self, fn):
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def _on_auth_event(self, event, session):
+        event = getattr(event, "value", event)
+        if event == "SIGNED_OUT":
+            # La renovacion automatica fallo y el cliente descarto la sesion
+            LOG.warning("Sesion de Supabase perdida; se inicia sesion de nuevo")
+            threading.Thread(target=self._reautenticar, daemon=True).start()
+            return
+        if event not in ("TOKEN_REFRESHED", "SIGNED_IN"):
+            return
+        token = getattr(session, "access_token", None)
+        if not token:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        for fn in listeners:
+            try:
+                fn(token)
+            except Exception:
+                LOG.exception("Error propagando el token renovado")
+
+    def _reautenticar(self):
+        client = self._client
+        if client is not None and not _ensure_authenticated(client):
+            LOG.error("No se pudo volver a iniciar sesion en Supabase")
+
+
+_SESION = _SesionSupabase()
+
+
 def _strip_invisible_chars(text):
     if text is None:
         return None
@@ -446,16 +591,6 @@ def _clean_text(value):
     return text if text else None
 
 
-def _normalize_nit(value):
-    text = _clean_text(value)
-    if not text:
-        return ""
-    text = text.replace(" ", "")
-    if re.fullmatch(r"\d+\.0+", text):
-        text = text.split(".", 1)[0]
-    return text.lower()
-
-
 def _normalize_name(value):
     text = _clean_text(value)
     return text.lower() if text else ""
@@ -468,6 +603,13 @@ def _header_key(value):
     return re.sub(r"[^a-z0-9]+", "", text.lower())
 
 
+def _collation_key(value):
+    """Clave de orden para textos en espanol: sin tildes ni mayusculas, con la n~ despues de la n."""
+    text = (_clean_text(value) or "").casefold().replace("ñ", "n\uffff")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
 def _make_il_password_hash(password, iterations=260000):
     # Hash compatible with RECA Inclusion Laboral offline login verification.
     pwd = str(password or "")
@@ -724,7 +866,7 @@ def check_for_updates():
 
 def conectar_supabase():
     """
-    Establece conexion con Supabase
+    Devuelve el cliente compartido de Supabase (ver _SesionSupabase)
 
     Returns:
         Client: Cliente de Supabase o None si hay error
@@ -733,8 +875,8 @@ def conectar_supabase():
         messagebox.showerror("Error", "Credenciales no configuradas")
         return None
     try:
-        client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-        if not _ensure_authenticated(client):
+        client = _SESION.cliente()
+        if client is None:
             messagebox.showerror(
                 "Error",
                 "No se pudo iniciar sesion automatica en Supabase.\n"
@@ -830,20 +972,21 @@ class FormularioEmpresa(tk.Toplevel):
         "por_confirmar": "Por Confirmar",
     }
 
-    def __init__(self, parent, supabase, empresa=None):
+    def __init__(self, parent, repos, empresa=None):
         """
         Inicializa el formulario
 
         Args:
             parent: Ventana padre
-            supabase: Cliente de Supabase
+            repos: Repositories con las tablas de datos
             empresa: Datos de empresa a editar (None para crear nueva)
         """
         super().__init__(parent)
         self.parent = parent
-        self.supabase = supabase
+        self.repos = repos
         self.empresa = empresa
         self.resultado = None
+        self.registro = None
         self.campos = {}
         self._asesores = []
         self._asesores_correo = {}
@@ -1220,20 +1363,15 @@ class FormularioEmpresa(tk.Toplevel):
         if not nombre:
             return correo
         try:
-            response = (self.supabase.table("profesionales")
-                        .select("nombre_profesional, correo_profesional")
-                        .eq("nombre_profesional", nombre)
-                        .limit(1)
-                        .execute())
-            existente = (response.data or [])
+            profesionales = self.repos["profesionales"]
+            existente = profesionales.get(
+                nombre, "nombre_profesional,correo_profesional", key="nombre_profesional"
+            )
             if existente:
-                correo_existente = (existente[0].get("correo_profesional") or "").strip()
+                correo_existente = (existente.get("correo_profesional") or "").strip()
                 final_correo = correo_existente or correo
                 if correo and correo != correo_existente:
-                    (self.supabase.table("profesionales")
-                        .update({"correo_profesional": correo})
-                        .eq("nombre_profesional", nombre)
-                        .execute())
+                    profesionales.update(nombre, {"correo_profesional": correo}, key="nombre_profesional")
                     final_correo = correo
                 self._profesionales_correo[nombre] = final_correo
                 if nombre not in self._profesionales:
@@ -1244,7 +1382,7 @@ class FormularioEmpresa(tk.Toplevel):
             payload = {"nombre_profesional": nombre}
             if correo:
                 payload["correo_profesional"] = correo
-            self.supabase.table("profesionales").insert(payload).execute()
+            profesionales.insert(payload)
             self._profesionales_correo[nombre] = correo
             if nombre not in self._profesionales:
                 self._profesionales.append(nombre)
@@ -1255,13 +1393,10 @@ class FormularioEmpresa(tk.Toplevel):
             raise
 
     def _cargar_catalogos(self):
-        if not self.supabase:
+        if not self.repos:
             return
         try:
-            asesores = (self.supabase.table("asesores")
-                        .select("nombre, email")
-                        .order("nombre", desc=False)
-                        .execute()).data or []
+            asesores = _listar_ordenado(self.repos["asesores"], "nombre,email", "nombre")
             nombres_asesores = []
             seen = set()
             for row in asesores:
@@ -1278,10 +1413,9 @@ class FormularioEmpresa(tk.Toplevel):
             LOG.exception("Error cargando asesores")
 
         try:
-            profesionales = (self.supabase.table("profesionales")
-                             .select("nombre_profesional, correo_profesional")
-                             .order("nombre_profesional", desc=False)
-                             .execute()).data or []
+            profesionales = self.repos["profesionales"].list(
+                "id,nombre_profesional,correo_profesional", order=("nombre_profesional", True)
+            )
             nombres_profesionales = []
             seen = set()
             for row in profesionales:
@@ -1366,6 +1500,12 @@ class FormularioEmpresa(tk.Toplevel):
             messagebox.showerror("Error", "La gestion es obligatoria")
             return
 
+        if not nit_dv_ok(datos.get("nit_empresa")) and not messagebox.askyesno(
+            "NIT",
+            "El digito de verificacion no corresponde al NIT.\n¿Guardar de todos modos?",
+        ):
+            return
+
         # Sincronizar profesional asignado con tabla 'profesionales'
         profesional_nombre = (datos.get("profesional_asignado") or "").strip()
         profesional_correo = (datos.get("correo_profesional") or "").strip()
@@ -1383,7 +1523,7 @@ class FormularioEmpresa(tk.Toplevel):
 
                 # Actualizar empresa existente
 
-                self.supabase.table("empresas").update(datos).eq("id", self.empresa["id"]).execute()
+                guardada = self.repos["empresas"].update(self.empresa["id"], datos)
                 LOG.info("Empresa actualizada: %s", datos.get("nombre_empresa"))
 
                 messagebox.showinfo("Éxito", "Empresa actualizada correctamente")
@@ -1392,13 +1532,15 @@ class FormularioEmpresa(tk.Toplevel):
 
                 # Crear nueva empresa
 
-                self.supabase.table("empresas").insert(datos).execute()
+                guardada = self.repos["empresas"].insert(datos)
                 LOG.info("Empresa creada: %s", datos.get("nombre_empresa"))
 
                 messagebox.showinfo("Éxito", "Empresa creada correctamente")
 
 
 
+            # PostgREST devuelve la fila guardada; la ventana principal la aplica en sitio
+            self.registro = guardada
             self.resultado = "guardado"
 
             self.destroy()
@@ -1446,11 +1588,12 @@ class FormularioEmpresa(tk.Toplevel):
 
         try:
 
-            self.supabase.table("empresas").delete().eq("id", self.empresa["id"]).execute()
+            self.repos["empresas"].delete(self.empresa["id"])
             LOG.info("Empresa eliminada: %s", self.empresa.get("nombre_empresa"))
 
             messagebox.showinfo("Éxito", "Empresa eliminada correctamente")
 
+            self.registro = self.empresa
             self.resultado = "eliminado"
 
             self.destroy()
@@ -1475,11 +1618,11 @@ class FormularioEntidad(tk.Toplevel):
         },
     }
 
-    def __init__(self, parent, supabase, tabla, campos, key_field, registro=None, titulo="Registro"):
+    def __init__(self, parent, repo, campos, key_field, registro=None, titulo="Registro"):
         super().__init__(parent)
         self.parent = parent
-        self.supabase = supabase
-        self.tabla = tabla
+        self.repo = repo
+        self.tabla = repo.table
         self.campos_config = campos
         self.key_field = key_field
         self.registro = registro
@@ -1571,10 +1714,10 @@ class FormularioEntidad(tk.Toplevel):
                 if self._original_key in (None, ""):
                     messagebox.showerror("Error", "El registro seleccionado no tiene una clave valida para actualizarse")
                     return
-                self.supabase.table(self.tabla).update(datos).eq(self.key_field, self._original_key).execute()
+                self.repo.update(self._original_key, datos, key=self.key_field)
                 messagebox.showinfo("Éxito", "Registro actualizado correctamente")
             else:
-                self.supabase.table(self.tabla).insert(datos).execute()
+                self.repo.insert(datos)
                 messagebox.showinfo("Éxito", "Registro creado correctamente")
             self.resultado = "guardado"
             self.destroy()
@@ -1589,7 +1732,7 @@ class FormularioEntidad(tk.Toplevel):
         if not confirmar:
             return
         try:
-            self.supabase.table(self.tabla).delete().eq(self.key_field, self._original_key).execute()
+            self.repo.delete(self._original_key, key=self.key_field)
             messagebox.showinfo("Éxito", "Registro eliminado correctamente")
             self.resultado = "eliminado"
             self.destroy()
@@ -1621,12 +1764,14 @@ class AppEntidad:
         self.order_by = order_by
 
         self.supabase = conectar_supabase()
+        self.repo = SupabaseRepository(self.supabase, self.table, key=self.key_field) if self.supabase else None
         self.registros = []
         self._registro_por_key = {}
         self.registro_seleccionado = None
 
         self._crear_interfaz()
         self.cargar_registros()
+        self._en_vivo = _CambiosEnVivo(self.root, self.supabase, {self.table: self.key_field}, self._aplicar_cambios_remotos)
 
     def _crear_interfaz(self):
         header = tk.Frame(self.root, bg=COLOR_PURPLE, height=72)
@@ -1737,16 +1882,14 @@ class AppEntidad:
             return
         try:
             hash_value = _make_il_password_hash(nueva)
-            response = self.supabase.rpc(
+            result = self.repo.rpc(
                 "admin_reset_profesional_password",
                 {
                     "p_profesional_id": int(profesional_id),
                     "p_new_password": nueva,
                     "p_new_password_hash": hash_value,
                 },
-            ).execute()
-
-            result = response.data
+            )
             auth_updated = False
             has_auth_user = False
             if isinstance(result, dict):
@@ -1782,10 +1925,10 @@ class AppEntidad:
         if not self.supabase:
             return
         try:
-            query = self.supabase.table(self.table).select("*")
             if self.order_by:
-                query = query.order(self.order_by, desc=False)
-            data = query.execute().data or []
+                data = _listar_ordenado(self.repo, "*", self.order_by)
+            else:
+                data = self.repo.list("*")
             self.registros = data
             self._registro_por_key = {}
             self._limpiar_tabla()
@@ -1796,28 +1939,89 @@ class AppEntidad:
             messagebox.showerror("Error", f"Error cargando registros: {e}")
 
     def _limpiar_tabla(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-    def _mostrar_registros(self, registros):
-        for idx, registro in enumerate(registros):
-            key_value = registro.get(self.key_field)
-            key_str = str(key_value) if key_value is not None else ""
-            if key_str:
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+
+    def _registro_key(self, registro):
+        key_value = registro.get(self.key_field)
+        return str(key_value) if key_value is not None else ""
+
+    def _mostrar_registros(self, registros, start=0):
+        """Inserta filas con iid igual a la clave del registro."""
+        for idx, registro in enumerate(registros, start):
+            key_str = self._registro_key(registro)
+            iid = key_str if key_str and not self.tree.exists(key_str) else None
+            if iid:
                 self._registro_por_key[key_str] = registro
             row_tag = "oddrow" if idx % 2 else "evenrow"
-            tags = (key_str, row_tag) if key_str else (row_tag,)
             values = [registro.get(col, "") for col in self.columns]
-            self.tree.insert("", tk.END, values=values, tags=tags)
+            self.tree.insert("", tk.END, iid=iid, values=values, tags=(row_tag,))
+
+    def _actualizar_registro(self, registro):
+        """Actualiza en sitio la fila de `registro` si esta en la tabla."""
+        key_str = self._registro_key(registro)
+        actual = self._registro_por_key.get(key_str)
+        if actual is None or not self.tree.exists(key_str):
+            return False
+        actual.update(registro)
+        self.tree.item(key_str, values=[actual.get(col, "") for col in self.columns])
+        return True
+
+    def _aplicar_cambios_remotos(self, cambios):
+        """
+        Aplica en sitio los cambios de Realtime, identificados por `key_field`.
+
+        Si la tabla tiene id se usa primero, asi un renombre reemplaza la fila
+        en lugar de duplicarla. Los DELETE solo traen la clave primaria salvo
+        con REPLICA IDENTITY FULL, necesario en las tablas con clave `nombre`.
+        """
+        por_id = {r.get("id"): r for r in self.registros if r.get("id") is not None}
+        agregados = []
+        for _table, kind, record in cambios:
+            actual = por_id.get(record.get("id")) if record.get("id") is not None else None
+            if actual is None:
+                actual = self._registro_por_key.get(self._registro_key(record))
+            if kind == "DELETE":
+                if actual is not None:
+                    por_id.pop(actual.get("id"), None)
+                    self._quitar_registro(self._registro_key(actual))
+                continue
+            if actual is not None and self._registro_key(actual) == self._registro_key(record):
+                self._actualizar_registro(record)
+                continue
+            if actual is not None:
+                # Cambio la clave visible (p. ej. se renombro): se reemplaza la fila
+                por_id.pop(actual.get("id"), None)
+                self._quitar_registro(self._registro_key(actual))
+            registro = dict(record)
+            self.registros.append(registro)
+            agregados.append(registro)
+            if registro.get("id") is not None:
+                por_id[registro["id"]] = registro
+        if agregados:
+            self._mostrar_registros(agregados, start=len(self.tree.get_children()))
+        self.contador_label.config(text=f"Resultados: {len(self.registros)} registros")
+
+    def _quitar_registro(self, key_str):
+        """Quita una fila en sitio y recalcula las franjas alternadas."""
+        registro = self._registro_por_key.pop(key_str, None)
+        if registro is None:
+            return False
+        self.registros = [r for r in self.registros if r is not registro]
+        if self.tree.exists(key_str):
+            self.tree.delete(key_str)
+        for idx, item in enumerate(self.tree.get_children()):
+            self.tree.item(item, tags=("oddrow" if idx % 2 else "evenrow",))
+        if self.registro_seleccionado is registro:
+            self.registro_seleccionado = None
+        self.contador_label.config(text=f"Resultados: {len(self.registros)} registros")
+        return True
 
     def _seleccionar(self, event):
         selection = self.tree.selection()
         if selection:
-            item = self.tree.item(selection[0])
-            registro_key = item["tags"][0] if item["tags"] else None
-            if registro_key is not None:
-                registro_key = str(registro_key)
-            self.registro_seleccionado = self._registro_por_key.get(registro_key)
+            self.registro_seleccionado = self._registro_por_key.get(selection[0])
 
     def _abrir_editar(self, event=None):
         if not self.registro_seleccionado:
@@ -1825,8 +2029,7 @@ class AppEntidad:
             return
         ventana = FormularioEntidad(
             self.root,
-            self.supabase,
-            self.table,
+            self.repo,
             self.form_config,
             self.key_field,
             registro=self.registro_seleccionado,
@@ -1841,8 +2044,7 @@ class AppEntidad:
             return
         ventana = FormularioEntidad(
             self.root,
-            self.supabase,
-            self.table,
+            self.repo,
             self.form_config,
             self.key_field,
             registro=None,
@@ -1866,11 +2068,10 @@ class AppEntidad:
         if not confirmar:
             return
         try:
-            self.supabase.table(self.table).delete().eq(
-                self.key_field, self.registro_seleccionado.get(self.key_field)
-            ).execute()
+            self.repo.delete(self.registro_seleccionado.get(self.key_field))
             messagebox.showinfo("Éxito", "Registro eliminado")
-            self.cargar_registros()
+            if not self._quitar_registro(self._registro_key(self.registro_seleccionado)):
+                self.cargar_registros()
         except Exception as e:
             LOG.exception("Error eliminando registro en %s", self.table)
             messagebox.showerror("Error", f"Error eliminando registro: {e}")
@@ -2175,6 +2376,269 @@ class AppMenu:
 
 
 
+class _VirtualGrid:
+    """
+    Lista virtual sobre un ttk.Treeview.
+
+    Las filas viven en una lista de Python y solo se crean items (con iid igual
+    al id de la fila) para la ventana visible; el scrollbar vertical se mapea a
+    indices del modelo en lugar de a items del widget.
+    """
+
+    WHEEL_ROWS = 3
+
+    def __init__(self, tree, scrollbar, values_fn, on_select=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.values_fn = values_fn
+        self.on_select = on_select
+        self.rows = []
+        self._painted_total = 0
+        self.top = 0
+        self.visible = max(1, int(tree.cget("height")))
+        self.selected_key = None
+
+        scrollbar.configure(command=self.yview)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(sequence, self._on_wheel)
+        for sequence in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            tree.bind(sequence, self._on_key)
+        tree.bind("<Configure>", self._on_configure, add="+")
+        tree.bind("<<TreeviewSelect>>", self._on_tree_select, add="+")
+
+    @staticmethod
+    def key_of(row):
+        return str(row.get("id"))
+
+    def set_rows(self, rows):
+        """Cambia (o vuelve a pintar) el modelo conservando la posicion."""
+        self.rows = rows
+        self.refresh()
+
+    def rows_appended(self, rows):
+        """Tras agregar filas al final: solo repinta si la ventana visible cambia."""
+        previous = len(self.rows) if self.rows is not rows else self._painted_total
+        self.rows = rows
+        if previous < self.top + self.visible:
+            self.refresh()
+        else:
+            self._update_scrollbar()
+
+    def clear(self):
+        self.rows = []
+        self.top = 0
+        self.selected_key = None
+        self.refresh()
+
+    def refresh(self):
+        """Vuelve a materializar la ventana visible en un solo paso."""
+        total = len(self.rows)
+        self.top = max(0, min(self.top, total - self.visible))
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        for idx in range(self.top, min(total, self.top + self.visible)):
+            row = self.rows[idx]
+            row_tag = "oddrow" if idx % 2 else "evenrow"
+            self.tree.insert("", tk.END, iid=self.key_of(row), values=self.values_fn(row), tags=(row_tag,))
+        if self.selected_key is not None and self.tree.exists(self.selected_key):
+            self.tree.selection_set(self.selected_key)
+            self.tree.focus(self.selected_key)
+        self._update_scrollbar()
+
+    def update_row(self, row):
+        """Actualiza en sitio los valores de una fila si esta materializada."""
+        key = self.key_of(row)
+        if self.tree.exists(key):
+            self.tree.item(key, values=self.values_fn(row))
+
+    def _update_scrollbar(self):
+        total = len(self.rows)
+        self._painted_total = total
+        if total <= self.visible:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / total, (self.top + self.visible) / total)
+
+    def yview(self, *args):
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            step = self.visible if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.refresh()
+
+    def index_of(self, key):
+        if key is None:
+            return None
+        window_end = min(len(self.rows), self.top + self.visible)
+        for idx in range(self.top, window_end):
+            if self.key_of(self.rows[idx]) == key:
+                return idx
+        for idx, row in enumerate(self.rows):
+            if self.key_of(row) == key:
+                return idx
+        return None
+
+    def select_index(self, idx):
+        if not self.rows:
+            return
+        idx = max(0, min(idx, len(self.rows) - 1))
+        if idx < self.top:
+            self.top = idx
+        elif idx >= self.top + self.visible:
+            self.top = idx - self.visible + 1
+        self.selected_key = self.key_of(self.rows[idx])
+        self.refresh()
+        if self.on_select:
+            self.on_select(self.rows[idx])
+
+    def _on_tree_select(self, _event=None):
+        selection = self.tree.selection()
+        if not selection or selection[0] == self.selected_key:
+            return
+        self.selected_key = selection[0]
+        idx = self.index_of(self.selected_key)
+        if idx is not None and self.on_select:
+            self.on_select(self.rows[idx])
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            delta = -1
+        elif event.num == 5:
+            delta = 1
+        else:
+            delta = -1 if event.delta > 0 else 1
+        self.top += delta * self.WHEEL_ROWS
+        self.refresh()
+        return "break"
+
+    def _on_key(self, event):
+        current = self.index_of(self.selected_key)
+        if current is None:
+            current = self.top
+        moves = {
+            "Up": -1,
+            "Down": 1,
+            "Prior": -self.visible,
+            "Next": self.visible,
+            "Home": -len(self.rows),
+            "End": len(self.rows),
+        }
+        self.select_index(current + moves.get(event.keysym, 0))
+        return "break"
+
+    def _on_configure(self, event):
+        rowheight = int(ttk.Style(self.tree).lookup("Treeview", "rowheight") or 20)
+        header = rowheight
+        children = self.tree.get_children()
+        if children:
+            bbox = self.tree.bbox(children[0])
+            if bbox:
+                header, rowheight = bbox[1], bbox[3]
+        visible = max(1, (event.height - header) // max(1, rowheight))
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+
+
+class _LoadState:
+    """Estado de la carga paginada de empresas."""
+
+    def __init__(self):
+        self.generation = 0
+        self.loading = False
+        self.all_loaded = False
+        self.loaded = 0
+        self.total = None
+        self.empty_message = None
+        self.reconcile = False
+        self.base = False
+        self.cache_key = None
+        self.pending = []
+        self.backlog = deque()
+
+    def reset(self, empty_message=None, reconcile=False):
+        """
+        Invalida cualquier pagina en vuelo y reinicia contadores.
+
+        Con `reconcile` las paginas se acumulan en `pending` en lugar de
+        pintarse, para comparar al final contra las filas ya mostradas.
+        """
+        self.generation += 1
+        self.loading = False
+        self.all_loaded = False
+        self.loaded = 0
+        self.total = None
+        self.empty_message = empty_message
+        self.reconcile = reconcile
+        self.base = False
+        self.cache_key = None
+        self.pending = []
+        self.backlog = deque()
+        return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+
+class _CambiosEnVivo:
+    """
+    Lleva a la ventana los cambios que otros usuarios hacen en sus tablas.
+
+    Cada POLL_MS toma del RealtimeFeed lo acumulado (ya agrupado por fila) y
+    lo entrega de una vez a `apply_fn`, asi una importacion masiva cuesta un
+    repintado por tramo y no uno por fila.
+    """
+
+    POLL_MS = 500
+
+    def __init__(self, root, client, tables, apply_fn):
+        self.root = root
+        self.apply_fn = apply_fn
+        self.feed = None
+        self._job = None
+        if client is None:
+            return
+        feed = RealtimeFeed(realtime_url(SUPABASE_URL, SUPABASE_ANON_KEY), tables, access_token=_SESION.token())
+        if not feed.start():
+            return
+        self.feed = feed
+        _SESION.suscribir(feed.set_access_token)
+        root.bind("<Destroy>", self._on_destroy, add="+")
+        self._job = root.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        self._job = None
+        if self.feed is None:
+            return
+        cambios = self.feed.drain()
+        if cambios:
+            try:
+                self.apply_fn(cambios)
+            except Exception:
+                LOG.exception("Error aplicando cambios en vivo")
+        self._job = self.root.after(self.POLL_MS, self._poll)
+
+    def stop(self):
+        if self.feed is not None:
+            _SESION.desuscribir(self.feed.set_access_token)
+            self.feed.stop()
+            self.feed = None
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except tk.TclError:
+                pass
+            self._job = None
+
+    def _on_destroy(self, event):
+        if event.widget is self.root:
+            self.stop()
+
+
 class AppRECA:
 
     """Aplicación principal de gestión de empresas"""
@@ -2236,6 +2700,67 @@ class AppRECA:
 
     BATCH_SIZE = 1000
 
+    # Intervalo (ms) con el que el hilo de Tk revisa las paginas recibidas
+    LOAD_POLL_MS = 50
+
+    # Filas incorporadas por tramo y tiempo maximo (ms) de trabajo por tramo
+    RENDER_SLICE = 250
+    FRAME_BUDGET_MS = 12
+
+    # Paginas descargadas en paralelo y tipo de conteo previo ("exact" o "planned")
+    PREFETCH_WORKERS = max(1, int(os.getenv("RECA_PREFETCH_WORKERS") or 4))
+    COUNT_MODE = os.getenv("RECA_COUNT_MODE") or "exact"
+
+    # Busqueda mientras se escribe: espera tras la ultima tecla (0 la desactiva)
+    # y largo minimo del termino cuando la busqueda tiene que ir al servidor
+    SEARCH_DEBOUNCE_MS = max(0, int(os.getenv("RECA_SEARCH_DEBOUNCE_MS") or 300))
+    LIVE_SEARCH_MIN_CHARS = 3
+
+    # Resultados recientes de busquedas y filtros que van al servidor
+    QUERY_CACHE_SIZE = 32
+    QUERY_CACHE_TTL = float(os.getenv("RECA_QUERY_CACHE_TTL") or 300)
+
+    # Columnas de los combos de filtros y vigencia de sus opciones
+    FILTER_COLUMNS = ("profesional_asignado", "asesor", "caja_compensacion", "zona_empresa", "estado")
+    FACETS_TTL = float(os.getenv("RECA_FACETS_TTL") or 600)
+
+    # Por fila se piden el id, las columnas visibles y las de filtros; el
+    # registro completo se trae al editar y se guarda en una cache pequena por ventana.
+    LIST_COLUMNS = COLUMNAS + ("caja_compensacion",)
+    LIST_SELECT = ",".join(("id",) + LIST_COLUMNS)
+    DETAIL_CACHE_SIZE = 64
+
+    # Columnas consultables en la replica local (grilla + filtros)
+    REPLICA_COLUMNS = LIST_COLUMNS
+
+    SEARCH_FIELD_COLUMNS = {
+        "Nombre": "nombre_empresa",
+        "NIT": "nit_empresa",
+        "Ciudad": "ciudad_empresa",
+        "Profesional": "profesional_asignado",
+        "Nombre aprox.": "nombre_empresa",
+    }
+
+    # Columnas normalizadas del servidor por columna buscada (ver _busqueda_normalizada)
+    SEARCH_KEY_COLUMNS = {
+        "nombre_empresa": "nombre_empresa_sk",
+        "nit_empresa": "nit_empresa_sk",
+        "ciudad_empresa": "ciudad_empresa_sk",
+        "profesional_asignado": "profesional_asignado_sk",
+    }
+    SEARCH_ALL_KEY_COLUMN = "busqueda_sk"
+
+    # Sin columnas normalizadas, un NIT mas corto se busca literal: "%9%0%0%" traeria casi todo
+    NIT_SPREAD_MIN_DIGITS = 6
+
+    # Busqueda aproximada (tolera errores de digitacion) sobre el nombre
+    FUZZY_FIELD = "Nombre aprox."
+    FUZZY_LIMIT = 200
+
+    # Columnas con sugerencias al escribir en la busqueda
+    AUTOCOMPLETE_COLUMNS = ("nombre_empresa", "nit_empresa", "ciudad_empresa", "profesional_asignado")
+    AUTOCOMPLETE_LIMIT = 12
+
 
 
     def __init__(self, root, progress_callback=None, on_ready=None):
@@ -2266,18 +2791,41 @@ class AppRECA:
         self._report_progress("Iniciando interfaz...", 5)
 
         # Inicializar variables
-        self._report_progress("Conectando a Supabase...", 15)
-        self.supabase = conectar_supabase()
+        self.supabase = None
+        self.repos = None
+        self.empresas_repo = None
+        self._replica = None
+        self._columnas_sk = None
         self.empresas_actuales = []
         self._empresa_por_id = {}
+        self._mostrando_cache = False
+        self._sin_conexion = False
+        self._snapshot_dirty = False
         self.empresa_seleccionada = None
-        self._offset = 0
-        self._all_loaded = False
-        self._is_loading = False
+        self._load_state = _LoadState()
+        self._detalle_cache = OrderedDict()
+        self._load_queue = queue.Queue()
+        self._drain_job = None
+        self._cambios_remotos = []
+        # Conjunto base (sin filtros ni busqueda) por id, con su indice de busqueda
+        self._base = None
+        self._base_completo = False
+        self._indice = SearchIndex(self.COLUMNAS)
+        self._indice_aprox = FuzzyIndex("nombre_empresa")
+        self._indice_nit = NitIndex()
+        self._sugerencias = {col: PrefixIndex() for col in self.AUTOCOMPLETE_COLUMNS}
+        self._cache_consultas = QueryCache(self.QUERY_CACHE_SIZE, self.QUERY_CACHE_TTL)
+        self._facetas = FacetProvider(self.FILTER_COLUMNS, ttl=self.FACETS_TTL)
+        self._conteos = FacetCounts(self.FILTER_COLUMNS)
+        self._etiquetas_filtro = {col: {} for col in self.FILTER_COLUMNS}
         self._search_term = ""
         self._search_field = "Todos"
+        self._busqueda_job = None
+        self._busqueda_aplicada = None
         self._sort_state = {}
-        self._profesionales_cache = []
+        self._sort_keys = {}
+        self._orden_actual = None
+        self._server_order = None
         self._filters = {
             "profesional_asignado": None,
             "asesor": None,
@@ -2290,11 +2838,73 @@ class AppRECA:
         self._filtros_loading = False
         self._latest_version = None
 
-        # Crear interfaz y cargar datos
+        # Crear interfaz, pintar el ultimo snapshot y luego conectar
         self._report_progress("Construyendo interfaz...", 35)
         self.crear_interfaz()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self._mostrar_snapshot()
+
+        self._report_progress("Conectando a Supabase...", 45)
+        self.supabase = conectar_supabase()
+        self.repos = Repositories.supabase(self.supabase) if self.supabase else None
+        self.empresas_repo = self.repos["empresas"] if self.repos else None
+        self._replica = _abrir_replica_empresas(self.REPLICA_COLUMNS) if self.supabase else None
         self._report_progress("Cargando empresas...", 55)
         self.cargar_todas_empresas()
+        self._en_vivo = _CambiosEnVivo(self.root, self.supabase, {"empresas": "id"}, self._recibir_cambios_remotos)
+
+    def _mostrar_snapshot(self):
+        """Pinta las empresas de la ultima sesion mientras llega la version fresca."""
+        columnas = ("id",) + self.COLUMNAS
+        try:
+            filas = load_rows_snapshot(_get_snapshot_path(), columnas)
+        except Exception:
+            LOG.exception("Error leyendo snapshot de empresas")
+            filas = []
+        if not filas:
+            return
+        self.empresas_actuales = filas
+        self._mostrar_empresas(filas)
+        self._mostrando_cache = True
+        self._update_contador()
+        self.root.update_idletasks()
+
+    def _guardar_snapshot(self):
+        """Guarda en disco (en segundo plano) el conjunto base mostrado."""
+        columnas = ("id",) + self.COLUMNAS
+        filas = list(self.empresas_actuales)
+        self._snapshot_dirty = False
+
+        def worker():
+            try:
+                save_rows_snapshot(_get_snapshot_path(), columnas, filas)
+            except Exception:
+                LOG.exception("Error guardando snapshot de empresas")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _es_consulta_base(self):
+        return not self._search_term and not any(
+            value and value != "Todos" for value in self._filters.values()
+        )
+
+    def _on_close(self):
+        if self._snapshot_dirty and self._es_consulta_base() and self._load_state.all_loaded:
+            try:
+                save_rows_snapshot(_get_snapshot_path(), ("id",) + self.COLUMNAS, self.empresas_actuales)
+            except Exception:
+                LOG.exception("Error guardando snapshot de empresas")
+        # Invalida la carga en curso: el hilo ve `cancelled` y deja de pedir paginas
+        self._load_state.reset()
+        for job in (self._drain_job, self._busqueda_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self._drain_job = None
+        self._busqueda_job = None
+        self._en_vivo.stop()
+        if self._replica is not None:
+            self._replica.close()
+        self.root.destroy()
 
     def _report_progress(self, message, value=None):
         if value is not None:
@@ -2408,7 +3018,7 @@ class AppRECA:
         )
         self.search_entry.pack(side=tk.LEFT, padx=SP_XS)
         self.search_entry.bind("<Return>", lambda e: self.buscar_empresas())
-        self.search_entry.bind("<KeyRelease>", lambda e: self._update_autocomplete())
+        self.search_entry.bind("<KeyRelease>", self._on_search_key)
 
         # Placeholder
         self._placeholder = "Escribe para buscar..."
@@ -2442,9 +3052,9 @@ class AppRECA:
 
         self.campo_busqueda = ttk.Combobox(
             search_frame,
-            values=["Todos", "Nombre", "NIT", "Ciudad", "Profesional"],
+            values=["Todos", "Nombre", "NIT", "Ciudad", "Profesional", self.FUZZY_FIELD],
             state="readonly",
-            width=8,
+            width=12,
         )
         self.campo_busqueda.set("Todos")
         self.campo_busqueda.pack(side=tk.LEFT, padx=5)
@@ -2517,6 +3127,15 @@ class AppRECA:
         self.filtro_estado = self._crear_filtro_combo(
             self.filtros_frame, "Estado", 1, 3
         )
+        self._filtro_combos = {
+            "profesional_asignado": self.filtro_profesional,
+            "asesor": self.filtro_asesor,
+            "caja_compensacion": self.filtro_caja,
+            "zona_empresa": self.filtro_zona,
+            "estado": self.filtro_estado,
+        }
+        for combo in self._filtro_combos.values():
+            combo.bind("<<ComboboxSelected>>", lambda _e: self._mostrar_opciones_filtros())
 
         btn_aplicar = _make_button(self.filtros_frame, "Aplicar", self.aplicar_filtros, style="secondary", font=FONT_BODY_BOLD)
         btn_aplicar.grid(row=1, column=5, padx=SP_XS, pady=SP_XS, sticky="w")
@@ -2560,6 +3179,14 @@ class AppRECA:
         )
         self.contador_label.grid(row=0, column=0, sticky="w", pady=5)
 
+        self.cargando_label = tk.Label(
+            tabla_frame,
+            text="",
+            font=FONT_SMALL,
+            fg=COLOR_TEAL,
+        )
+        self.cargando_label.grid(row=0, column=0, sticky="e", pady=5)
+
         # Treeview
         self.tree = ttk.Treeview(
             tabla_frame,
@@ -2579,14 +3206,11 @@ class AppRECA:
             # Ancho de columna
             self.tree.column(col, width=self.ANCHOS_COLUMNAS.get(col, 100))
 
-        def on_scrollbar(*args):
-            self.tree.yview(*args)
-            self._maybe_load_next()
-
-        # Scrollbars
-        scroll_y = ttk.Scrollbar(tabla_frame, orient=tk.VERTICAL, command=on_scrollbar)
+        # Scrollbars (el vertical lo controla la lista virtual)
+        scroll_y = ttk.Scrollbar(tabla_frame, orient=tk.VERTICAL)
         scroll_x = ttk.Scrollbar(tabla_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscroll=scroll_y.set, xscroll=scroll_x.set)
+        self.tree.configure(xscroll=scroll_x.set)
+        self.tabla_virtual = _VirtualGrid(self.tree, scroll_y, self._valores_fila, on_select=self.seleccionar)
 
         # Grid layout
         self.tree.grid(row=1, column=0, sticky="nsew")
@@ -2597,103 +3221,426 @@ class AppRECA:
         tabla_frame.grid_columnconfigure(0, weight=1)
 
         # Eventos
-        self.tree.bind("<ButtonRelease-1>", self.seleccionar)
         self.tree.bind("<Double-1>", self.abrir_editar)
-        self.tree.bind("<MouseWheel>", lambda e: self._maybe_load_next())
-        self.tree.bind("<Button-4>", lambda e: self._maybe_load_next())
-        self.tree.bind("<Button-5>", lambda e: self._maybe_load_next())
-        self.tree.bind("<KeyRelease-Next>", lambda e: self._maybe_load_next())
-        self.tree.bind("<Configure>", lambda e: self._maybe_load_next())
 
         # Filas alternadas
         self.tree.tag_configure("oddrow", background=TREE_ROW_ALT)
         self.tree.tag_configure("evenrow", background=COLOR_WHITE)
 
-    def _reset_paginacion(self):
-        self._offset = 0
-        self._all_loaded = False
-        self._is_loading = False
+    def _reset_paginacion(self, empty_message=None):
+        self._load_state.reset(empty_message)
+        # Las claves de orden se conservan: estan por id y se invalidan al editar
+        self._orden_actual = None
+        self._mostrando_cache = False
         self.empresas_actuales = []
         self._empresa_por_id = {}
         self.empresa_seleccionada = None
         self._limpiar_tabla()
         self._update_contador()
         self._update_autocomplete_values()
+        self._update_cargando()
 
     def _build_or_filter(self, term):
-        safe_term = self._sanitize_search_term(term)
-        columnas = [
-            "nombre_empresa",
-            "nit_empresa",
-            "ciudad_empresa",
-            "estado",
-            "zona_empresa",
-            "profesional_asignado",
-            "asesor",
-            "contacto_empresa",
-            "telefono_empresa",
-            "sede_empresa",
-        ]
-        return ",".join([f"{col}.ilike.%{safe_term}%" for col in columnas])
+        """Pares (columna, patron) para buscar `term` tal cual en cualquier columna visible."""
+        pattern = self._ilike_pattern(term)
+        return [(col, pattern) for col in self.COLUMNAS]
+
+    def _ilike_pattern(self, term, normalizar=False):
+        """
+        Patron ilike de contencion; los espacios pasan a comodin libre.
+
+        Con `normalizar` el termino se lleva a search_key, para compararlo con
+        las columnas *_sk del servidor (ver _busqueda_normalizada).
+        """
+        term = self._sanitize_search_term(term)
+        if normalizar:
+            term = search_key(term)
+        return "%" + "%".join(term.split()) + "%"
+
+    def _busqueda_normalizada(self):
+        """
+        True si `empresas` tiene las columnas de busqueda sin tildes.
+
+        Son columnas generadas en el servidor; con ellas el ilike no distingue
+        tildes y sigue siendo tan selectivo como la busqueda:
+
+            create extension if not exists unaccent;
+            create function reca_search_key(text) returns text language sql immutable as $$
+              select lower(regexp_replace(public.unaccent('public.unaccent', coalesce($1, '')), '\\s+', ' ', 'g'))
+            $$;
+            alter table empresas
+              add column nombre_empresa_sk text generated always as (reca_search_key(nombre_empresa)) stored,
+              add column ciudad_empresa_sk text generated always as (reca_search_key(ciudad_empresa)) stored,
+              add column profesional_asignado_sk text
+                generated always as (reca_search_key(profesional_asignado)) stored,
+              add column nit_empresa_sk text
+                generated always as (regexp_replace(coalesce(nit_empresa, ''), '\\D', '', 'g')) stored,
+              add column busqueda_sk text generated always as (reca_search_key(concat_ws(' | ',
+                nombre_empresa, nit_empresa, ciudad_empresa, estado, zona_empresa, profesional_asignado,
+                asesor, contacto_empresa, telefono_empresa, sede_empresa))) stored;
+
+        Sin ellas se envia el termino tal cual (distingue tildes) y se avisa una
+        vez en el log. Se consulta desde el hilo de carga.
+        """
+        if self._columnas_sk is None:
+            columnas = ",".join((self.SEARCH_ALL_KEY_COLUMN,) + tuple(self.SEARCH_KEY_COLUMNS.values()))
+            try:
+                self.empresas_repo.page(columnas, limit=1)
+                self._columnas_sk = True
+            except Exception as exc:
+                if not is_missing_column_error(exc):
+                    raise
+                LOG.warning("empresas no tiene columnas *_sk: la busqueda en el servidor distingue tildes")
+                self._columnas_sk = False
+        return self._columnas_sk
+
+    @staticmethod
+    def _coincide_termino(fila, termino_key, columnas):
+        if any(termino_key in search_key(fila.get(col)) for col in columnas):
+            return True
+        # Buscando por NIT, "900123456" tambien encuentra "900.123.456-7"
+        nit = canonical_nit(termino_key) if tuple(columnas) == ("nit_empresa",) else ""
+        return bool(nit) and nit in canonical_nit(fila.get("nit_empresa"))
 
     def _sanitize_search_term(self, term):
         safe_term = re.sub(r"[^\w\s@.-]", " ", term, flags=re.UNICODE)
         safe_term = re.sub(r"\s+", " ", safe_term).strip()
         return safe_term
 
-    def _load_next_page(self):
-        if not self.supabase or self._all_loaded or self._is_loading:
+    def _query_params(self):
+        """Congela filtros y busqueda actuales para usarlos desde los hilos de carga."""
+        filtros = [(col, value) for col, value in self._filters.items() if value and value != "Todos"]
+        search_term = self._search_term
+        if not search_term:
+            search_columns = ()
+        elif self._search_field == "Todos":
+            search_columns = self.COLUMNAS
+        else:
+            search_columns = (self.SEARCH_FIELD_COLUMNS.get(self._search_field, "nombre_empresa"),)
+        return {
+            "filters": filtros,
+            "search_term": search_term,
+            "search_columns": search_columns,
+            "order": self._server_order,
+        }
+
+    @staticmethod
+    def _cache_key(params):
+        """Clave normalizada de una consulta para QueryCache."""
+        return (
+            search_key(params["search_term"]),
+            tuple(params["search_columns"]),
+            tuple(sorted(params["filters"])),
+            params["order"],
+        )
+
+    def _ilike_filters(self, params):
+        """Pares (columna, patron ilike) de la busqueda de `params` para el repositorio."""
+        search_term = params["search_term"]
+        search_columns = params["search_columns"]
+        if not search_term:
+            return []
+        nit = canonical_nit(search_term) if tuple(search_columns) == ("nit_empresa",) else ""
+        if self._busqueda_normalizada():
+            if nit:
+                return [(self.SEARCH_KEY_COLUMNS["nit_empresa"], f"%{nit}%")]
+            columna = self.SEARCH_ALL_KEY_COLUMN
+            if len(search_columns) == 1:
+                # Sin columna propia se busca en todas y _coincide_termino afina
+                columna = self.SEARCH_KEY_COLUMNS.get(search_columns[0], columna)
+            return [(columna, self._ilike_pattern(search_term, normalizar=True))]
+        if len(search_columns) > 1:
+            return self._build_or_filter(search_term)
+        if len(nit) >= self.NIT_SPREAD_MIN_DIGITS:
+            # Los digitos en orden con cualquier separador; _coincide_termino afina
+            return [(search_columns[0], "%" + "%".join(nit) + "%")]
+        return [(search_columns[0], self._ilike_pattern(search_term))]
+
+    def _start_load(self, sync=False, order=None):
+        """
+        Carga la consulta actual en un hilo de fondo; las paginas llegan por la cola.
+
+        Args:
+            sync: Si es True, primero trae a la replica local los cambios del servidor
+            order: Orden (columna, ascendente) pedido al servidor solo para esta
+                consulta; sin el la carga usa la descarga paralela por id
+        """
+        state = self._load_state
+        if not self.supabase or state.loading:
             return
-        self._is_loading = True
+        self._server_order = order
+        params = self._query_params()
+        state.base = not params["filters"] and not params["search_term"]
+        if state.base:
+            self._base = {}
+            self._base_completo = False
+            self._invalidar_orden()
+            self._limpiar_indices()
+            self._cache_consultas.invalidate()
+        elif not state.reconcile:
+            state.cache_key = self._cache_key(params)
+            filas = None if sync else self._cache_consultas.get(state.cache_key)
+            LOG.info("Cache de consultas %s: %s", "acierto" if filas is not None else "fallo", self._cache_consultas.stats())
+            if filas is not None:
+                self._mostrar_filas_locales(filas)
+                return
+        state.loading = True
+        threading.Thread(
+            target=self._run_load,
+            args=(state.generation, params, sync),
+            daemon=True,
+        ).start()
+        self._update_cargando()
+        self._schedule_drain()
+
+    def _run_load(self, generation, params, sync):
+        indexar = not params["filters"] and not params["search_term"]
+        termino_key = search_key(params["search_term"])
+
+        def put(kind, payload=None):
+            if kind == "page" and indexar and self._load_state.is_current(generation):
+                self._indexar(payload)
+            if kind == "page" and termino_key:
+                # El patron ilike es mas amplio que la busqueda: se afina aqui
+                payload = [
+                    fila for fila in payload
+                    if self._coincide_termino(fila, termino_key, params["search_columns"])
+                ]
+            self._load_queue.put((generation, kind, payload))
+
+        def cancelled():
+            return not self._load_state.is_current(generation)
+
+        started = time.perf_counter()
         try:
-            query = self.supabase.table("empresas").select("*").order("id", desc=False)
-            for col, value in self._filters.items():
-                if value and value != "Todos":
-                    query = query.eq(col, value)
-            if self._search_term:
-                if self._search_field == "Todos":
-                    query = query.or_(self._build_or_filter(self._search_term))
-                else:
-                    campo_columna = {
-                        "Nombre": "nombre_empresa",
-                        "NIT": "nit_empresa",
-                        "Ciudad": "ciudad_empresa",
-                        "Profesional": "profesional_asignado",
-                    }.get(self._search_field, "nombre_empresa")
-                    query = query.ilike(campo_columna, f"%{self._search_term}%")
-            query = query.range(self._offset, self._offset + self.BATCH_SIZE - 1)
-            response = query.execute()
-            data = response.data or []
-            if not data:
-                self._all_loaded = True
+            if self._replica is not None and self._load_from_replica(put, params, sync, cancelled):
+                put("done", time.perf_counter() - started)
                 return
-            self._offset += len(data)
-            self.empresas_actuales.extend(data)
-            self._mostrar_empresas(data)
+            if cancelled():
+                return
+            # Sin orden las paginas llegan en paralelo por tramos de id; con
+            # orden por columna se pagina en secuencia sobre (columna, id)
+            total, pages = self.empresas_repo.scan(
+                self.LIST_SELECT,
+                params["filters"],
+                self._ilike_filters(params),
+                order=params["order"],
+                page_size=self.BATCH_SIZE,
+                workers=self.PREFETCH_WORKERS,
+                count=self.COUNT_MODE,
+                cancelled=cancelled,
+            )
+            put("total", total)
+            for data in pages:
+                put("page", data)
+            put("done", time.perf_counter() - started)
+        except Exception as exc:
+            LOG.exception("Error cargando empresas")
+            put("error", exc)
+
+    def _load_from_replica(self, put, params, sync, cancelled):
+        """
+        Sirve la consulta desde la replica SQLite; False si hay que ir a Supabase.
+
+        La carga base espera a una sincronizacion en curso; las busquedas y
+        filtros no: mientras la replica no esta lista van al servidor.
+        """
+        replica = self._replica
+        if sync or not replica.is_synced():
+            base = not params["filters"] and not params["search_term"]
+            started = time.perf_counter()
+            try:
+                changes = replica.sync(
+                    self.empresas_repo,
+                    workers=self.PREFETCH_WORKERS,
+                    page_size=self.BATCH_SIZE,
+                    cancelled=cancelled,
+                    block=base,
+                )
+                if changes is not None:
+                    LOG.info("Replica de empresas sincronizada: %s cambios en %.2fs", changes, time.perf_counter() - started)
+            except Exception:
+                LOG.exception("Error sincronizando la replica local de empresas")
+            if cancelled() or not replica.is_synced():
+                return False
+        rows = replica.query(("id",) + self.LIST_COLUMNS, **params)
+        put("total", len(rows))
+        for idx in range(0, len(rows), self.BATCH_SIZE):
+            put("page", rows[idx:idx + self.BATCH_SIZE])
+        return True
+
+    def _indexar(self, filas):
+        # Puede correr en el hilo de carga: ambos indices tienen su propio lock
+        self._indice.add(filas)
+        self._indice_aprox.add(filas)
+        self._indice_nit.add(filas)
+        self._conteos.add(filas)
+        for col, sugerencias in self._sugerencias.items():
+            sugerencias.add(fila.get(col) for fila in filas)
+
+    def _desindexar(self, filas):
+        ids = [fila.get("id") for fila in filas]
+        self._indice.remove(ids)
+        self._indice_aprox.remove(ids)
+        self._indice_nit.remove(ids)
+        self._conteos.remove(ids)
+        for col, sugerencias in self._sugerencias.items():
+            sugerencias.remove(fila.get(col) for fila in filas)
+
+    def _limpiar_indices(self):
+        self._indice.clear()
+        self._indice_aprox.clear()
+        self._indice_nit.clear()
+        self._conteos.clear()
+        for sugerencias in self._sugerencias.values():
+            sugerencias.clear()
+
+    def _schedule_drain(self, delay=None):
+        if self._drain_job is None:
+            delay = self.LOAD_POLL_MS if delay is None else delay
+            self._drain_job = self.root.after(delay, self._drain_load_queue)
+
+    def _drain_load_queue(self):
+        """
+        Procesa lo recibido por la cola en tramos de RENDER_SLICE filas.
+
+        Cada llamada se limita a FRAME_BUDGET_MS; si queda trabajo se
+        reprograma con after(0) para que Tk atienda teclado y scroll entre tramos.
+        """
+        self._drain_job = None
+        if not self.root.winfo_exists():
+            return
+        state = self._load_state
+        while True:
+            try:
+                generation, kind, payload = self._load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if state.is_current(generation):
+                state.backlog.append([kind, payload, 0])
+
+        deadline = time.perf_counter() + self.FRAME_BUDGET_MS / 1000.0
+        ingested = 0
+        while state.backlog and time.perf_counter() < deadline:
+            entry = state.backlog[0]
+            kind, payload, start = entry
+            if kind == "page":
+                end = start + self.RENDER_SLICE
+                self._ingest_rows(payload[start:end])
+                ingested += len(payload[start:end])
+                if end >= len(payload):
+                    state.backlog.popleft()
+                else:
+                    entry[2] = end
+                continue
+            state.backlog.popleft()
+            if ingested:
+                self._after_ingest()
+                ingested = 0
+            if kind == "total":
+                state.total = payload
+            elif kind == "done":
+                self._on_load_finished(elapsed=payload)
+            elif kind == "error":
+                self._on_load_finished(error=payload)
+        if ingested:
+            self._after_ingest()
+
+        if state.backlog:
+            self._schedule_drain(0)
+        elif state.loading:
+            self._schedule_drain()
+
+    def _ingest_rows(self, rows):
+        state = self._load_state
+        state.loaded += len(rows)
+        if state.base:
+            # El indice de busqueda ya lo alimenta el hilo de carga
+            for empresa in rows:
+                self._base[str(empresa.get("id"))] = empresa
+        if state.reconcile:
+            state.pending.extend(rows)
+            return
+        self.empresas_actuales.extend(rows)
+        self._orden_actual = None
+        for empresa in rows:
+            empresa_id = empresa.get("id")
+            if empresa_id is not None:
+                self._empresa_por_id[str(empresa_id)] = empresa
+
+    def _after_ingest(self):
+        """Actualiza grilla y contadores una vez por tramo, no por fila."""
+        if not self._load_state.reconcile:
+            self.tabla_virtual.rows_appended(self.empresas_actuales)
             next_value = min(90, max(self._progress_value, 60) + 10)
             self._report_progress(f"Cargando empresas... ({len(self.empresas_actuales)})", next_value)
-            if len(data) < self.BATCH_SIZE:
-                self._all_loaded = True
             self._update_contador()
             self._update_autocomplete_values()
-            if not self._all_loaded:
-                self.root.after(0, self._maybe_load_next)
-        except Exception as e:
-            LOG.exception("Error cargando empresas")
-            messagebox.showerror("Error", f"Error cargando empresas: {e}")
-            self._all_loaded = True
-        finally:
-            self._is_loading = False
+        self._update_cargando()
+        self._finish_ready()
 
-    def _maybe_load_next(self):
-        if self._all_loaded or self._is_loading:
+    def _on_load_finished(self, elapsed=None, error=None):
+        state = self._load_state
+        state.loading = False
+        state.all_loaded = True
+        self._update_cargando()
+        self._finish_ready()
+        if state.base:
+            self._base_completo = error is None
+            if error is not None:
+                self._base = None
+                self._limpiar_indices()
+            self._mostrar_opciones_filtros()
+        if error is not None:
+            if state.reconcile:
+                self.contador_label.config(text=f"Resultados: {len(self.empresas_actuales)} empresas (en cache)")
+            self._aplicar_cambios_retenidos()
+            messagebox.showerror("Error", f"Error cargando empresas: {error}")
             return
-        first, last = self.tree.yview()
-        if last >= 0.98:
-            self._load_next_page()
+        if state.reconcile:
+            self._reconciliar_snapshot(state.pending)
+            state.pending = []
+        if self._server_order and self._orden_actual != self._server_order:
+            # Deja el orden final con las mismas claves que usa el toggle local
+            self._aplicar_orden_local(*self._server_order)
+        # Despues del reconcile: las paginas pudieron traerse antes del cambio
+        self._aplicar_cambios_retenidos()
+        if self._es_consulta_base():
+            self._guardar_snapshot()
+        if state.cache_key is not None:
+            self._cache_consultas.put(state.cache_key, self.empresas_actuales)
+        LOG.info(
+            "Empresas cargadas: %s filas en %.2fs (%s hilos)",
+            state.loaded,
+            elapsed or 0.0,
+            self.PREFETCH_WORKERS,
+        )
+        if not self.empresas_actuales and state.empty_message:
+            messagebox.showinfo("Info", state.empty_message)
+
+    def _aplicar_cambios_retenidos(self):
+        """Aplica los cambios (en vivo o locales) que llegaron durante la carga."""
+        if self._cambios_remotos:
+            self._recibir_cambios_remotos([])
+
+    def _update_cargando(self):
+        state = self._load_state
+        if state.loading:
+            if state.total:
+                texto = f"Cargando... {state.loaded} de {state.total} empresas"
+            else:
+                texto = f"Cargando... {state.loaded} empresas"
+        else:
+            texto = ""
+        self.cargando_label.config(text=texto)
 
     def _update_contador(self):
-        self.contador_label.config(text=f"Resultados: {len(self.empresas_actuales)} empresas")
+        texto = f"Resultados: {len(self.empresas_actuales)} empresas"
+        if self._mostrando_cache:
+            texto += " (en cache, actualizando...)"
+        elif self._sin_conexion:
+            texto += " (sin conexion)"
+        self.contador_label.config(text=texto)
 
     def _crear_botones_accion(self, parent, compact=False):
         """Crea los botones de accion principales"""
@@ -2787,28 +3734,44 @@ class AppRECA:
 
     def _fetch_existing_empresa_pairs(self):
         existing_pairs = set()
-        offset = 0
-        while True:
-            query = (
-                self.supabase.table("empresas")
-                .select("nit_empresa,nombre_empresa")
-                .order("id", desc=False)
-                .range(offset, offset + self.BATCH_SIZE - 1)
-            )
-            data = query.execute().data or []
-            if not data:
-                break
+        for data in self.empresas_repo.iter_pages("id,nit_empresa,nombre_empresa", page_size=self.BATCH_SIZE):
             for row in data:
                 key_pair = (
-                    _normalize_nit(row.get("nit_empresa")),
+                    canonical_nit(row.get("nit_empresa")),
                     _normalize_name(row.get("nombre_empresa")),
                 )
                 existing_pairs.add(key_pair)
-            offset += len(data)
-            if len(data) < self.BATCH_SIZE:
-                break
         return existing_pairs
 
+    def _existing_empresa_lookup(self):
+        """
+        Devuelve una funcion (nit, nombre) -> bool con ambos ya normalizados.
+
+        Con todas las empresas en memoria los NIT se resuelven por el indice hash
+        sin ir al servidor; si no, se descargan una vez los pares (NIT, nombre).
+        """
+        if not self._base_completo:
+            existing_pairs = self._fetch_existing_empresa_pairs()
+            return lambda nit, nombre: (nit, nombre) in existing_pairs
+
+        base = self._base
+        sin_nit = None
+
+        def exists(nit, nombre):
+            nonlocal sin_nit
+            if nit:
+                filas = (base.get(str(empresa_id)) for empresa_id in self._indice_nit.lookup(nit))
+                return any(fila is not None and _normalize_name(fila.get("nombre_empresa")) == nombre for fila in filas)
+            if sin_nit is None:
+                sin_nit = {
+                    _normalize_name(fila.get("nombre_empresa"))
+                    for fila in base.values()
+                    if not canonical_nit(fila.get("nit_empresa"))
+                }
+            return nombre in sin_nit
+
+        return exists
+
     def _crear_tab_resumen_importacion(self, parent, title, rows, with_checkbox=False, on_selection_change=None):
         frame = tk.Frame(parent)
         parent.add(frame, text=f"{title} ({len(rows)})")
@@ -2938,18 +3901,17 @@ class AppRECA:
             return
 
         try:
-            inserted = 0
-            chunk_size = 200
-            for idx in range(0, len(empresas_a_subir), chunk_size):
-                chunk = empresas_a_subir[idx:idx + chunk_size]
-                self.supabase.table("empresas").insert(chunk).execute()
-                inserted += len(chunk)
+            creadas = self.empresas_repo.insert_many(empresas_a_subir, chunk_size=200)
+            inserted = len(empresas_a_subir)
 
             LOG.info("Importacion Excel empresas completada. Insertadas: %s", inserted)
             messagebox.showinfo("Importacion", f"Importacion completada.\nEmpresas subidas: {inserted}")
             if window and window.winfo_exists():
                 window.destroy()
-            self.cargar_todas_empresas()
+            if len(creadas) == inserted:
+                self._aplicar_filas(creadas)
+            else:
+                self.cargar_todas_empresas()
         except Exception as e:
             LOG.exception("Error subiendo importacion Excel de empresas")
             messagebox.showerror("Error", f"No se pudo completar la importacion:\n{e}")
@@ -3061,7 +4023,7 @@ class AppRECA:
                 return
 
             idx = self._build_excel_index_map(list(header_row))
-            existing_pairs = self._fetch_existing_empresa_pairs()
+            empresa_existe = self._existing_empresa_lookup()
 
             nuevas = []
             repetidas_bd = []
@@ -3075,7 +4037,7 @@ class AppRECA:
                     continue
 
                 key_pair = (
-                    _normalize_nit(record.get("nit_empresa")),
+                    canonical_nit(record.get("nit_empresa")),
                     _normalize_name(record.get("nombre_empresa")),
                 )
                 if not key_pair[0] and not key_pair[1]:
@@ -3087,7 +4049,7 @@ class AppRECA:
                     continue
 
                 seen_in_file.add(key_pair)
-                if key_pair in existing_pairs:
+                if empresa_existe(*key_pair):
                     repetidas_bd.append(record)
                 else:
                     nuevas.append(record)
@@ -3112,77 +4074,198 @@ class AppRECA:
         Carga empresas con paginacion por lotes.
         """
         if not self.supabase:
+            # Sin cliente no llegara la version fresca: lo visible queda como esta
+            self._mostrando_cache = False
+            self._sin_conexion = True
+            self._update_contador()
             self._finish_ready()
             return
 
         self._search_term = ""
         self._search_field = "Todos"
-        self._reset_paginacion()
-        self._load_next_page()
+        self._busqueda_aplicada = None
+        empty_message = "No hay empresas en la base de datos"
+        if self._mostrando_cache and self._es_consulta_base():
+            # Se mantiene la grilla del snapshot y se corrige al terminar la carga
+            self._load_state.reset(empty_message, reconcile=True)
+        else:
+            self._reset_paginacion(empty_message=empty_message)
+        self._start_load(sync=True)
 
-        if self._all_loaded and not self.empresas_actuales:
-            messagebox.showinfo("Info", "No hay empresas en la base de datos")
-        self._finish_ready()
 
+    def buscar_empresas(self, en_vivo=False):
+        """
+        Busca empresas segun el termino y campo seleccionado.
 
-    def buscar_empresas(self):
-        """Busca empresas segun el termino y campo seleccionado"""
+        Args:
+            en_vivo: Llamada desde la busqueda mientras se escribe; no muestra
+                avisos y omite terminos cortos que irian al servidor
+        """
+        self._cancelar_busqueda_programada()
         if not self.supabase:
             return
 
         termino = self.search_entry.get().strip()
         if not termino or self._placeholder_active:
-            self.cargar_todas_empresas()
+            if not en_vivo:
+                self.cargar_todas_empresas()
+            elif self._busqueda_aplicada:
+                self._busqueda_aplicada = None
+                self._search_term = ""
+                if self._base_completo:
+                    self._consultar_en_memoria(empty_message=None)
+                else:
+                    self.cargar_todas_empresas()
             return
         termino = self._sanitize_search_term(termino)
         if not termino:
-            messagebox.showwarning("Aviso", "Ingresa un texto de busqueda valido")
+            if not en_vivo:
+                messagebox.showwarning("Aviso", "Ingresa un texto de busqueda valido")
             return
 
+        campo = self.campo_busqueda.get()
+        if en_vivo:
+            if (termino, campo) == self._busqueda_aplicada:
+                return
+            if not self._base_completo and len(termino) < self.LIVE_SEARCH_MIN_CHARS:
+                return
+        empty_message = None if en_vivo else "No hay resultados"
+        self._busqueda_aplicada = (termino, campo)
         self._search_term = termino
-        self._search_field = self.campo_busqueda.get()
-        self._reset_paginacion()
-        self._load_next_page()
+        self._search_field = campo
+        if self._base_completo and campo == self.FUZZY_FIELD:
+            self._buscar_aproximado(empty_message)
+            return
+        if self._base_completo:
+            self._consultar_en_memoria(empty_message)
+            return
+        if campo == self.FUZZY_FIELD:
+            LOG.info("Busqueda aproximada sin empresas cargadas: se busca por subcadena en el servidor")
+        # El reset cambia la generacion: las paginas de la busqueda anterior se descartan
+        self._reset_paginacion(empty_message=empty_message)
+        self._start_load()
 
-        if self._all_loaded and not self.empresas_actuales:
-            messagebox.showinfo("Info", "No hay resultados")
+    def _on_search_key(self, event=None):
+        self._update_autocomplete()
+        if event is not None and event.keysym in ("Return", "KP_Enter", "Escape", "Up", "Down", "Tab"):
+            return
+        self._programar_busqueda()
+
+    def _programar_busqueda(self):
+        """Reinicia la espera de la busqueda en vivo tras cada tecla."""
+        if not self.SEARCH_DEBOUNCE_MS:
+            return
+        self._cancelar_busqueda_programada()
+        self._busqueda_job = self.root.after(self.SEARCH_DEBOUNCE_MS, lambda: self.buscar_empresas(en_vivo=True))
+
+    def _cancelar_busqueda_programada(self):
+        if self._busqueda_job is not None:
+            self.root.after_cancel(self._busqueda_job)
+            self._busqueda_job = None
+
+    def _consultar_en_memoria(self, empty_message="No hay resultados"):
+        """Resuelve busqueda y filtros actuales con el conjunto base ya cargado."""
+        started = time.perf_counter()
+        params = self._query_params()
+        ids = None
+        if params["search_term"]:
+            ids = self._ids_en_memoria(params["search_term"], params["search_columns"])
+        # Los filtros salen de los conjuntos por valor del agregado de filtros
+        filtradas = self._conteos.matching(dict(params["filters"]))
+        if filtradas is not None:
+            ids = filtradas if ids is None else ids & filtradas
+        base = self._base.values()
+        filas = list(base) if ids is None else [fila for fila in base if fila.get("id") in ids]
+        self._reset_paginacion(empty_message=empty_message)
+        LOG.info(
+            "Consulta en memoria '%s' %s: %s filas en %.1f ms",
+            params["search_term"],
+            params["filters"],
+            len(filas),
+            (time.perf_counter() - started) * 1000,
+        )
+        self._mostrar_filas_locales(filas)
+
+    def _ids_en_memoria(self, termino, columnas):
+        """Ids que coinciden con `termino`; un NIT exacto se resuelve por hash."""
+        if tuple(columnas) == ("nit_empresa",) and canonical_nit(termino):
+            ids = self._indice_nit.lookup(termino)
+            if ids:
+                return ids
+            return self._indice.search(termino, columnas) | self._indice_nit.containing(termino)
+        return self._indice.search(termino, columnas)
+
+    def _buscar_aproximado(self, empty_message="No hay resultados"):
+        """Busca por nombre tolerando errores y muestra primero lo mas parecido."""
+        started = time.perf_counter()
+        resultados = self._indice_aprox.search(self._search_term, limit=self.FUZZY_LIMIT)
+        filtradas = self._conteos.matching(dict(self._query_params()["filters"]))
+        filas = []
+        for empresa_id, _score in resultados:
+            fila = self._base.get(str(empresa_id))
+            if fila is not None and (filtradas is None or empresa_id in filtradas):
+                filas.append(fila)
+        self._reset_paginacion(empty_message=empty_message)
+        LOG.info(
+            "Busqueda aproximada '%s': %s filas en %.1f ms",
+            self._search_term,
+            len(filas),
+            (time.perf_counter() - started) * 1000,
+        )
+        self._mostrar_filas_locales(filas, ordenar=False)
+
+    def _mostrar_filas_locales(self, filas, ordenar=True):
+        """Muestra como resultado completo filas resueltas sin ir al servidor."""
+        state = self._load_state
+        state.all_loaded = True
+        state.loaded = state.total = len(filas)
+        self.empresas_actuales = filas
+        self._empresa_por_id = {str(fila.get("id")): fila for fila in filas}
+        if ordenar and self._server_order:
+            self._aplicar_orden_local(*self._server_order)
+        else:
+            self.tabla_virtual.set_rows(filas)
+        self._update_contador()
+        self._update_autocomplete_values()
+        self._finish_ready()
+        if not filas and state.empty_message:
+            messagebox.showinfo("Info", state.empty_message)
 
     def limpiar_busqueda(self):
         """Limpia el campo de busqueda y recarga todas las empresas"""
+        self._cancelar_busqueda_programada()
         self.search_entry.set(self._placeholder)
         self.search_entry.config(foreground="#999999")
         self._placeholder_active = True
         self.campo_busqueda.set("Todos")
-        self.cargar_todas_empresas()
+        if self._base_completo:
+            self._search_term = ""
+            self._search_field = "Todos"
+            self._busqueda_aplicada = None
+            self._consultar_en_memoria()
+        else:
+            self.cargar_todas_empresas()
         self._update_autocomplete()
 
     def _on_search_field_change(self):
         self._search_field = self.campo_busqueda.get()
         self._update_autocomplete_values()
         self._update_autocomplete()
+        if self._search_term:
+            self._programar_busqueda()
 
     def _update_autocomplete_values(self):
-        if self._search_field == "Profesional":
-            profesionales = []
-            for empresa in self.empresas_actuales:
-                valor = (empresa.get("profesional_asignado") or "").strip()
-                if valor:
-                    profesionales.append(valor)
-            self._profesionales_cache = sorted(set(profesionales))
-        else:
-            self._profesionales_cache = []
-        if self._search_field != "Profesional":
+        # Las sugerencias se mantienen al indexar; aqui solo se apagan si el campo no tiene
+        if self.SEARCH_FIELD_COLUMNS.get(self._search_field) not in self._sugerencias:
             self.search_entry["values"] = []
 
     def _update_autocomplete(self):
-        if self.campo_busqueda.get() != "Profesional":
-            return
-        term = self.search_entry.get().strip().lower()
-        if not term:
-            self.search_entry["values"] = self._profesionales_cache
+        sugerencias = self._sugerencias.get(self.SEARCH_FIELD_COLUMNS.get(self.campo_busqueda.get()))
+        if sugerencias is None:
+            self.search_entry["values"] = []
             return
-        matches = [p for p in self._profesionales_cache if term in p.lower()]
-        self.search_entry["values"] = matches
+        term = "" if self._placeholder_active else self.search_entry.get()
+        self.search_entry["values"] = sugerencias.suggest(term, self.AUTOCOMPLETE_LIMIT)
 
     def _toggle_filtros(self):
         if self._filtros_visible:
@@ -3191,60 +4274,86 @@ class AppRECA:
             return
         self.filtros_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
         self._filtros_visible = True
-        if not self._filtros_loaded:
+        if not self._filtros_loaded or not self._facetas.fresh():
             self._load_filter_options()
+        else:
+            self._mostrar_opciones_filtros()
 
     def _load_filter_options(self):
+        """Trae en segundo plano los valores distintos de cada filtro."""
         if not self.supabase or self._filtros_loading:
             return
         self._filtros_loading = True
-        options = {
-            "profesional_asignado": set(),
-            "asesor": set(),
-            "caja_compensacion": set(),
-            "zona_empresa": set(),
-            "estado": set(),
-        }
-        offset = 0
-        try:
-            while True:
-                query = (self.supabase.table("empresas")
-                         .select("profesional_asignado, asesor, caja_compensacion, zona_empresa, estado")
-                         .order("id", desc=False)
-                         .range(offset, offset + self.BATCH_SIZE - 1))
-                data = query.execute().data or []
-                if not data:
-                    break
-                for row in data:
-                    for key in options:
-                        valor = (row.get(key) or "").strip()
-                        if valor:
-                            options[key].add(valor)
-                offset += len(data)
-                if len(data) < self.BATCH_SIZE:
-                    break
-        except Exception:
-            LOG.exception("Error cargando opciones de filtros")
-        finally:
-            self._filtros_loading = False
-
-        self.filtro_profesional["values"] = ["Todos"] + sorted(options["profesional_asignado"])
-        self.filtro_asesor["values"] = ["Todos"] + sorted(options["asesor"])
-        self.filtro_caja["values"] = ["Todos"] + sorted(options["caja_compensacion"])
-        self.filtro_zona["values"] = ["Todos"] + sorted(options["zona_empresa"])
-        self.filtro_estado["values"] = ["Todos"] + sorted(options["estado"])
+        source = self._fuente_facetas()
+
+        def worker():
+            started = time.perf_counter()
+            options = None
+            try:
+                options = self._facetas.get(source)
+                LOG.info("Opciones de filtros cargadas en %.2fs", time.perf_counter() - started)
+            except Exception:
+                LOG.exception("Error cargando opciones de filtros")
+            self.root.after(0, lambda: self._on_filter_options(options))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _fuente_facetas(self):
+        """Origen de las opciones: la replica si ya esta sincronizada, si no la RPC."""
+        columnas = self.FILTER_COLUMNS
+        replica = self._replica
+        if replica is not None and replica.is_synced():
+            return lambda: replica.distinct_values(columnas)
+        repo = self.empresas_repo
+        return lambda: repo.distinct(columnas)
+
+    def _on_filter_options(self, options):
+        self._filtros_loading = False
+        if options is None or not self.root.winfo_exists():
+            return
         self._filtros_loaded = True
+        self._mostrar_opciones_filtros()
+
+    def _mostrar_opciones_filtros(self):
+        """
+        Llena los combos con "valor (n)": cuantas empresas quedarian con ese
+        valor y lo elegido en los otros combos. Los conteos salen del agregado
+        en memoria, asi que solo aparecen con todas las empresas cargadas.
+        """
+        options = self._facetas.get()
+        if options is None or not self._filtros_visible:
+            return
+        seleccion = {col: self._valor_filtro(col) for col in self.FILTER_COLUMNS}
+        conteos = self._conteos.counts(seleccion) if self._base_completo else None
+        for col, combo in self._filtro_combos.items():
+            etiquetas = {"Todos": None}
+            for valor in options[col]:
+                etiqueta = valor if conteos is None else f"{valor} ({conteos[col].get(valor, 0)})"
+                etiquetas[etiqueta] = valor
+            self._etiquetas_filtro[col] = etiquetas
+            combo["values"] = list(etiquetas)
+            elegido = seleccion[col]
+            if elegido is not None:
+                combo.set(next((etiqueta for etiqueta, valor in etiquetas.items() if valor == elegido), elegido))
+
+    def _valor_filtro(self, col):
+        """Valor real elegido en el combo de `col` (sin el conteo); None para "Todos"."""
+        etiqueta = self._filtro_combos[col].get()
+        if etiqueta == "Todos":
+            return None
+        return self._etiquetas_filtro[col].get(etiqueta, etiqueta) or None
 
     def aplicar_filtros(self):
-        self._filters = {
-            "profesional_asignado": self.filtro_profesional.get(),
-            "asesor": self.filtro_asesor.get(),
-            "caja_compensacion": self.filtro_caja.get(),
-            "zona_empresa": self.filtro_zona.get(),
-            "estado": self.filtro_estado.get(),
-        }
+        self._filters = {col: self._valor_filtro(col) for col in self.FILTER_COLUMNS}
+        self._aplicar_consulta_filtros()
+
+    def _aplicar_consulta_filtros(self):
+        """Con todas las empresas cargadas filtra en memoria; si no, consulta al servidor."""
+        if self._base_completo:
+            self._consultar_en_memoria(empty_message=None)
+            return
         self._reset_paginacion()
-        self._load_next_page()
+        self._start_load()
 
     def limpiar_filtros(self):
         self.filtro_profesional.set("Todos")
@@ -3254,38 +4363,71 @@ class AppRECA:
         self.filtro_estado.set("Todos")
         for key in self._filters:
             self._filters[key] = None
-        self._reset_paginacion()
-        self._load_next_page()
+        self._mostrar_opciones_filtros()
+        self._aplicar_consulta_filtros()
 
     def _sort_key(self, value):
         if value is None:
-            return (1, "")
+            return (1, "", "")
         value = str(value).strip()
         if not value:
-            return (1, "")
+            return (1, "", "")
         try:
-            return (0, float(value.replace(",", ".")))
+            return (0, float(value.replace(",", ".")), "")
         except ValueError:
-            return (1, value.lower())
+            return (1, _collation_key(value), value)
+
+    def _sort_keys_for(self, col):
+        """Claves de orden de `col` por id; solo se calculan para filas nuevas o editadas."""
+        keys = self._sort_keys.setdefault(col, {})
+        for empresa in self.empresas_actuales:
+            empresa_id = empresa.get("id")
+            if empresa_id not in keys:
+                keys[empresa_id] = self._sort_key(empresa.get(col))
+        return keys
+
+    def _invalidar_orden(self, empresa_id=None):
+        self._orden_actual = None
+        if empresa_id is None:
+            self._sort_keys = {}
+        else:
+            for keys in self._sort_keys.values():
+                keys.pop(empresa_id, None)
+
+    def _aplicar_orden_local(self, col, ascending):
+        if self._orden_actual == (col, not ascending):
+            # Misma columna ya ordenada: basta invertir la permutacion
+            self.empresas_actuales.reverse()
+        else:
+            keys = self._sort_keys_for(col)
+            self.empresas_actuales.sort(key=lambda empresa: keys[empresa.get("id")], reverse=not ascending)
+        self._orden_actual = (col, ascending)
+        self.tabla_virtual.set_rows(self.empresas_actuales)
 
     def ordenar_columna(self, col):
-        """Ordena la tabla por la columna seleccionada (toggle asc/desc)"""
+        """
+        Ordena la tabla por la columna seleccionada (toggle asc/desc).
+
+        Si una busqueda o filtro aun no termino de cargar, ordenar lo recibido
+        dejaria filas fuera de lugar; en ese caso se recarga pidiendo el orden
+        al servidor (o a la replica) y la primera pagina ya llega ordenada. La
+        carga base no se reinicia: se ordena lo recibido y, al terminar, todo.
+        """
         ascending = self._sort_state.get(col, True)
-        items = [(self.tree.set(k, col), k) for k in self.tree.get_children("")]
-        items.sort(key=lambda item: self._sort_key(item[0]), reverse=not ascending)
-        for index, (_, k) in enumerate(items):
-            self.tree.move(k, "", index)
         self._sort_state[col] = not ascending
+        state = self._load_state
+        if not state.all_loaded and not self._mostrando_cache and self.supabase:
+            if not state.base and not self._base_completo:
+                self._reset_paginacion(state.empty_message)
+                self._start_load(order=(col, ascending))
+                return
+        # Si la carga base sigue, _on_load_finished vuelve a aplicarlo con todas las filas
+        self._server_order = (col, ascending)
+        self._aplicar_orden_local(col, ascending)
 
-    def seleccionar(self, event):
-        """Maneja la seleccion de una empresa con un click"""
-        selection = self.tree.selection()
-        if selection:
-            item = self.tree.item(selection[0])
-            empresa_id = item["tags"][0] if item["tags"] else None
-            if empresa_id is not None:
-                empresa_id = str(empresa_id)
-            self.empresa_seleccionada = self._empresa_por_id.get(empresa_id)
+    def seleccionar(self, empresa):
+        """Maneja la seleccion de una empresa en la lista virtual"""
+        self.empresa_seleccionada = self._empresa_por_id.get(str(empresa.get("id")))
 
     def abrir_editar(self, event=None):
 
@@ -3309,17 +4451,51 @@ class AppRECA:
 
 
 
-        ventana = FormularioEmpresa(self.root, self.supabase, self.empresa_seleccionada)
+        empresa = self._obtener_empresa_completa(self.empresa_seleccionada.get("id"))
+
+        if not empresa:
+
+            return
+
+        ventana = FormularioEmpresa(self.root, self.repos, empresa)
 
         self.root.wait_window(ventana)
 
 
 
-        # Recargar si hubo cambios
+        # Aplicar el cambio en la grilla sin recargar
 
-        if ventana.resultado:
+        if ventana.resultado == "eliminado":
 
-            self.cargar_todas_empresas()
+            self._aplicar_eliminacion(empresa.get("id"))
+
+        elif ventana.resultado:
+
+            self._aplicar_guardado(ventana.registro)
+
+
+
+    def _obtener_empresa_completa(self, empresa_id):
+        """Trae todas las columnas de una empresa (la grilla solo carga las visibles)."""
+        if empresa_id is None or not self.supabase:
+            return None
+        cached = self._detalle_cache.get(empresa_id)
+        if cached is not None:
+            self._detalle_cache.move_to_end(empresa_id)
+            return cached
+        try:
+            empresa = self.empresas_repo.get(empresa_id)
+        except Exception as e:
+            LOG.exception("Error cargando detalle de empresa id=%s", empresa_id)
+            messagebox.showerror("Error", f"Error cargando empresa: {e}")
+            return None
+        if empresa is None:
+            messagebox.showwarning("Aviso", "La empresa ya no existe en la base de datos")
+            return None
+        self._detalle_cache[empresa_id] = empresa
+        while len(self._detalle_cache) > self.DETAIL_CACHE_SIZE:
+            self._detalle_cache.popitem(last=False)
+        return empresa
 
 
 
@@ -3333,17 +4509,17 @@ class AppRECA:
 
 
 
-        ventana = FormularioEmpresa(self.root, self.supabase)
+        ventana = FormularioEmpresa(self.root, self.repos)
 
         self.root.wait_window(ventana)
 
 
 
-        # Recargar si se creó
+        # Agregar la nueva empresa sin recargar
 
         if ventana.resultado:
 
-            self.cargar_todas_empresas()
+            self._aplicar_guardado(ventana.registro)
 
 
 
@@ -3387,13 +4563,11 @@ class AppRECA:
 
         if confirmar:
             try:
-                (self.supabase.table("empresas")
-                    .delete()
-                    .eq("id", self.empresa_seleccionada["id"])
-                    .execute())
+                self.empresas_repo.delete(self.empresa_seleccionada["id"])
                 LOG.info("Empresa eliminada (principal): %s", self.empresa_seleccionada.get("nombre_empresa"))
+                empresa_id = self.empresa_seleccionada.get("id")
                 messagebox.showinfo("?xito", "Empresa eliminada")
-                self.cargar_todas_empresas()
+                self._aplicar_eliminacion(empresa_id)
             except Exception as e:
                 LOG.exception("Error eliminando empresa (principal)")
                 messagebox.showerror("Error", f"Error eliminando: {e}")
@@ -3404,34 +4578,157 @@ class AppRECA:
 
         """Limpia todos los elementos de la tabla"""
 
-        for item in self.tree.get_children():
+        self.tabla_virtual.clear()
 
-            self.tree.delete(item)
 
 
+    def _valores_fila(self, empresa):
+        return tuple(empresa.get(col, "") for col in self.COLUMNAS)
 
     def _mostrar_empresas(self, empresas):
-        """Muestra empresas en la tabla"""
-        existing_count = len(self.tree.get_children())
-        for idx, empresa in enumerate(empresas, start=existing_count):
+        """Registra las empresas nuevas y repinta la ventana visible"""
+        for empresa in empresas:
             empresa_id = empresa.get("id")
-            empresa_id_str = str(empresa_id) if empresa_id is not None else ""
-            if empresa_id_str:
-                self._empresa_por_id[empresa_id_str] = empresa
-            row_tag = "oddrow" if idx % 2 else "evenrow"
-            tags = (empresa_id_str, row_tag) if empresa_id_str else (row_tag,)
-            self.tree.insert("", tk.END, values=(
-                empresa.get("nombre_empresa", ""),
-                empresa.get("nit_empresa", ""),
-                empresa.get("ciudad_empresa", ""),
-                empresa.get("estado", ""),
-                empresa.get("zona_empresa", ""),
-                empresa.get("profesional_asignado", ""),
-                empresa.get("asesor", ""),
-                empresa.get("contacto_empresa", ""),
-                empresa.get("telefono_empresa", ""),
-                empresa.get("sede_empresa", ""),
-            ), tags=tags)
+            if empresa_id is not None:
+                self._empresa_por_id[str(empresa_id)] = empresa
+        self.tabla_virtual.set_rows(self.empresas_actuales)
+
+    def _coincide_consulta(self, empresa):
+        """Indica si `empresa` entra en los filtros y la busqueda actuales."""
+        params = self._query_params()
+        if any(empresa.get(col) != value for col, value in params["filters"]):
+            return False
+        term = search_key(params["search_term"])
+        if not term:
+            return True
+        return self._coincide_termino(empresa, term, params["search_columns"])
+
+    def _aplicar_filas(self, guardadas=(), eliminadas=()):
+        """
+        Aplica filas guardadas y ids eliminados sin recargar.
+
+        Actualiza replica, cache de detalle, conjunto base con su indice y la
+        consulta visible; la grilla se repinta una sola vez por llamada.
+        Durante una carga se encolan con los cambios en vivo: una pagina en
+        vuelo puede traer la misma fila y la duplicaria o la pisaria.
+        """
+        guardadas = [fila for fila in guardadas if fila.get("id") is not None]
+        eliminadas = [empresa_id for empresa_id in eliminadas if empresa_id is not None]
+        if self._load_state.loading:
+            for empresa_id in [fila["id"] for fila in guardadas] + eliminadas:
+                self._detalle_cache.pop(empresa_id, None)
+            self._cambios_remotos.extend(("empresas", "UPDATE", fila) for fila in guardadas)
+            self._cambios_remotos.extend(("empresas", "DELETE", {"id": empresa_id}) for empresa_id in eliminadas)
+            return
+        if self._replica is not None:
+            self._replica.upsert_rows(guardadas)
+            self._replica.mark_deleted(eliminadas)
+        # Una fila guardada puede entrar en cualquier consulta; una baja solo
+        # afecta a las que la contenian
+        if guardadas:
+            self._cache_consultas.invalidate()
+            self._facetas.add_rows(guardadas)
+        elif eliminadas:
+            self._cache_consultas.invalidate(eliminadas)
+
+        base = self._base
+        nuevas = []
+        for registro in guardadas:
+            empresa_id = registro.get("id")
+            key = str(empresa_id)
+            self._detalle_cache.pop(empresa_id, None)
+            actual = self._empresa_por_id.get(key) or (base.get(key) if base is not None else None)
+            if base is not None and key in base:
+                # Sale con sus valores viejos y vuelve a entrar abajo con los nuevos
+                self._desindexar([dict(base[key])])
+            if actual is None:
+                actual = {"id": empresa_id}
+                actual.update({col: registro.get(col) for col in self.LIST_COLUMNS})
+            else:
+                actual.update({col: registro.get(col) for col in self.LIST_COLUMNS if col in registro})
+            if base is not None:
+                base[key] = actual
+                self._indexar([actual])
+            self._invalidar_orden(empresa_id)
+            if key not in self._empresa_por_id and self._coincide_consulta(actual):
+                self._empresa_por_id[key] = actual
+                nuevas.append(actual)
+
+        quitadas = set()
+        for empresa_id in eliminadas:
+            key = str(empresa_id)
+            self._detalle_cache.pop(empresa_id, None)
+            fila = base.pop(key, None) if base is not None else None
+            if fila is not None:
+                self._desindexar([fila])
+            if self._empresa_por_id.pop(key, None) is not None:
+                quitadas.add(key)
+        if quitadas:
+            self.empresas_actuales = [e for e in self.empresas_actuales if str(e.get("id")) not in quitadas]
+            if self.empresa_seleccionada and str(self.empresa_seleccionada.get("id")) in quitadas:
+                self.empresa_seleccionada = None
+                self.tabla_virtual.selected_key = None
+        if nuevas:
+            self.empresas_actuales.extend(nuevas)
+
+        if guardadas or quitadas:
+            self._snapshot_dirty = True
+            self.tabla_virtual.set_rows(self.empresas_actuales)
+            self._update_contador()
+            self._update_autocomplete_values()
+        if guardadas or eliminadas:
+            # Nuevos valores y conteos de los filtros
+            self._mostrar_opciones_filtros()
+
+    def _recibir_cambios_remotos(self, cambios):
+        """Encola los cambios de Realtime; durante una carga se aplican al terminarla."""
+        self._cambios_remotos.extend(cambios)
+        if self._load_state.loading:
+            return
+        cambios, self._cambios_remotos = self._cambios_remotos, []
+        guardadas = {}
+        eliminadas = {}
+        for _table, kind, record in cambios:
+            key = str(record.get("id"))
+            if kind == "DELETE":
+                guardadas.pop(key, None)
+                eliminadas[key] = record.get("id")
+            else:
+                eliminadas.pop(key, None)
+                guardadas[key] = record
+        self._aplicar_filas(guardadas.values(), eliminadas.values())
+        LOG.info("Cambios en vivo aplicados: %s guardadas, %s eliminadas", len(guardadas), len(eliminadas))
+
+    def _aplicar_guardado(self, registro):
+        """Refleja en grilla, cache y replica la fila devuelta por el formulario."""
+        if not registro or registro.get("id") is None:
+            # Sin representacion (p. ej. politicas RLS): unica salida es recargar
+            self.cargar_todas_empresas()
+            return
+        self._aplicar_filas([registro])
+
+    def _aplicar_eliminacion(self, empresa_id):
+        self._aplicar_filas(eliminadas=[empresa_id])
+
+    def _reconciliar_snapshot(self, filas):
+        """Reemplaza el modelo del snapshot por `filas` sin mover la vista."""
+        previas = self._empresa_por_id
+        nuevas = {str(fila["id"]): fila for fila in filas}
+        cambios = sum(
+            1 for empresa_id, fila in nuevas.items()
+            if self._valores_fila(previas.get(empresa_id, {})) != self._valores_fila(fila)
+        ) + sum(1 for empresa_id in previas if empresa_id not in nuevas)
+
+        self.empresas_actuales = list(filas)
+        self._empresa_por_id = nuevas
+        self._invalidar_orden()
+        self._mostrando_cache = False
+        if self.empresa_seleccionada:
+            self.empresa_seleccionada = nuevas.get(str(self.empresa_seleccionada.get("id")))
+        self.tabla_virtual.set_rows(self.empresas_actuales)
+        self._update_contador()
+        self._update_autocomplete_values()
+        LOG.info("Snapshot de empresas reconciliado: %s filas cambiadas", cambios)
 
 # ============================================
 # THEME HELPERS
@@ -3577,6 +4874,8 @@ if __name__ == "__main__":
             root.deiconify()
 
         splash.set_status("Iniciando aplicacion...", 20)
+        # Login en segundo plano: la primera ventana encuentra la sesion lista
+        threading.Thread(target=_SESION.precargar, daemon=True).start()
         AppMenu(root)
         on_ready()
 
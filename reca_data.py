@@ -0,0 +1,1415 @@
+# -*- coding: utf-8 -*-
+"""Acceso a datos de Supabase compartido por la app y los scripts."""
+import bisect
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from websockets.sync.client import connect as _ws_connect
+except ImportError:  # sin websockets la app funciona, solo sin cambios en vivo
+    _ws_connect = None
+
+LOG = logging.getLogger("reca")
+
+PAGE_SIZE = 1000
+
+
+def search_key(value):
+    """Texto normalizado para busquedas: sin tildes, sin mayusculas y con espacios simples."""
+    if value is None:
+        return ""
+    text = str(value)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+# Pesos de la DIAN para el digito de verificacion, desde el digito menos significativo
+_NIT_WEIGHTS = (3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71)
+
+
+def nit_check_digit(base):
+    """Digito de verificacion (modulo 11 de la DIAN) de un NIT sin DV, como texto."""
+    total = sum(int(digit) * weight for digit, weight in zip(reversed(base), _NIT_WEIGHTS))
+    rest = total % 11
+    return str(rest if rest < 2 else 11 - rest)
+
+
+def split_nit(value):
+    """
+    Separa un NIT en (numero, dv) con el numero solo en digitos y sin ceros a la izquierda.
+
+    Acepta "900.123.456-7", "900 123 456", "900123456.0" (celda numerica de
+    Excel) y similares. El DV se toma de lo que va despues del ultimo guion; sin
+    guion, un numero de 10 digitos que empieza por 8 o 9 solo se parte si su
+    ultimo digito es el DV correcto de los 9 primeros. `dv` es None si no viene.
+    """
+    if value is None:
+        return "", None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip()
+    if re.fullmatch(r"\d+\.0+", text):
+        text = text.split(".", 1)[0]
+    head, sep, tail = text.rpartition("-")
+    dv = re.sub(r"\D", "", tail) if sep else ""
+    if sep and len(dv) == 1 and re.search(r"\d", head):
+        base = re.sub(r"\D", "", head)
+    else:
+        base, dv = re.sub(r"\D", "", text), ""
+        if len(base) == 10 and base[0] in "89" and nit_check_digit(base[:9]) == base[9]:
+            base, dv = base[:9], base[9]
+    return base.lstrip("0"), dv or None
+
+
+def canonical_nit(value):
+    """Forma canonica de un NIT (solo el numero, sin DV) para comparar e indexar."""
+    return split_nit(value)[0]
+
+
+def nit_dv_ok(value):
+    """False solo si el NIT trae un DV que no corresponde al numero."""
+    base, dv = split_nit(value)
+    return dv is None or not base or nit_check_digit(base) == dv
+
+
+def fetch_keyset_page(query, after=None, page_size=PAGE_SIZE, key="id"):
+    """
+    Trae una pagina ordenada por `key` empezando despues de `after`.
+
+    Args:
+        query: Query de PostgREST ya filtrada (sin order ni range)
+        after: Ultimo valor de `key` visto (None para la primera pagina)
+        page_size: Tamano maximo de la pagina
+        key: Columna unica usada como cursor
+
+    Returns:
+        list: Filas de la pagina
+    """
+    if after is not None:
+        query = query.gt(key, after)
+    return query.order(key, desc=False).limit(page_size).execute().data or []
+
+
+def iter_keyset_pages(build_query, page_size=PAGE_SIZE, key="id"):
+    """
+    Recorre una tabla completa con cursor `key > ultimo` en lugar de offsets.
+
+    Args:
+        build_query: Funcion sin argumentos que devuelve la query base;
+            el select debe incluir `key`
+        page_size: Tamano de cada pagina
+        key: Columna unica usada como cursor
+
+    Yields:
+        list: Filas de cada pagina, en orden de `key`
+    """
+    after = None
+    while True:
+        data = fetch_keyset_page(build_query(), after, page_size, key)
+        if not data:
+            return
+        yield data
+        if len(data) < page_size:
+            return
+        after = data[-1][key]
+
+
+def fetch_key_bounds(build_query, key="id", count="exact"):
+    """
+    Obtiene el total de filas y el rango de `key` de una consulta.
+
+    Args:
+        build_query: Funcion (columns, count) que devuelve la query base
+        key: Columna unica usada como cursor
+        count: Tipo de conteo de PostgREST ("exact", "planned" o "estimated")
+
+    Returns:
+        tuple: (total, key minima, key maxima); (0, None, None) si no hay filas
+    """
+    low = build_query(key, count).order(key, desc=False).limit(1).execute()
+    if not low.data:
+        return 0, None, None
+    high = build_query(key, None).order(key, desc=True).limit(1).execute()
+    total = low.count if low.count is not None else 0
+    return total, low.data[0][key], (high.data or low.data)[0][key]
+
+
+def _partition_bounds(low, high, parts):
+    step = max(1, -(-(high - low + 1) // parts))
+    bounds = []
+    start = low
+    while start <= high:
+        end = min(high, start + step - 1)
+        bounds.append((start, end))
+        start = end + 1
+    return bounds
+
+
+def iter_partitioned_pages(build_query, columns, total, low, high, workers=4,
+                           page_size=PAGE_SIZE, key="id", cancelled=None):
+    """
+    Descarga un rango de `key` en paralelo partiendolo en tramos contiguos.
+
+    Cada tramo se recorre con cursor keyset y los tramos se entregan en orden,
+    asi que las paginas salen ordenadas por `key` igual que en una lectura
+    secuencial.
+
+    Args:
+        build_query: Funcion (columns, count) que devuelve la query base
+        columns: Columnas a seleccionar (deben incluir `key`)
+        total: Total de filas esperado (define cuantos tramos crear)
+        low, high: Rango de `key` devuelto por fetch_key_bounds
+        workers: Maximo de peticiones simultaneas
+        page_size: Tamano de cada pagina
+        key: Columna entera unica usada como cursor
+        cancelled: Funcion opcional; si devuelve True se deja de descargar
+
+    Yields:
+        list: Filas de cada pagina, en orden de `key`
+    """
+    cancelled = cancelled or (lambda: False)
+    parts = -(-total // page_size)
+    if workers <= 1 or parts <= 1 or not isinstance(low, int) or not isinstance(high, int):
+        yield from iter_keyset_pages(lambda: build_query(columns, None), page_size, key)
+        return
+
+    def fetch_range(start, end):
+        pages = []
+        after = None
+        while not cancelled():
+            query = build_query(columns, None).gte(key, start).lte(key, end)
+            data = fetch_keyset_page(query, after, page_size, key)
+            if data:
+                pages.append(data)
+            if len(data) < page_size:
+                break
+            after = data[-1][key]
+        return pages
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reca-page")
+    try:
+        futures = [executor.submit(fetch_range, start, end) for start, end in _partition_bounds(low, high, parts)]
+        for future in futures:
+            for page in future.result():
+                if cancelled():
+                    return
+                yield page
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _quote_filter_value(value):
+    text = str(value).replace('"', '\\"')
+    return f'"{text}"'
+
+
+def fetch_seek_page(query, column, after=None, page_size=PAGE_SIZE, key="id", desc=False):
+    """
+    Pagina keyset sobre el par (`column`, `key`) para columnas no unicas.
+
+    Sigue el orden por defecto de Postgres: ascendente con nulos al final y
+    descendente con nulos al inicio; `key` desempata en la misma direccion.
+
+    Args:
+        query: Query de PostgREST ya filtrada
+        column: Columna de orden principal
+        after: Tupla (valor, key) de la ultima fila vista o None
+        page_size: Tamano maximo de la pagina
+        key: Columna unica de desempate
+        desc: Orden descendente
+
+    Returns:
+        list: Filas de la pagina
+    """
+    if after is not None:
+        value, last_key = after
+        op = "lt" if desc else "gt"
+        if value is None and not desc:
+            query = query.is_(column, "null").gt(key, last_key)
+        elif value is None:
+            query = query.or_(f"and({column}.is.null,{key}.lt.{last_key}),{column}.not.is.null")
+        else:
+            quoted = _quote_filter_value(value)
+            condition = f"{column}.{op}.{quoted},and({column}.eq.{quoted},{key}.{op}.{last_key})"
+            if not desc:
+                condition += f",{column}.is.null"
+            query = query.or_(condition)
+    return (query.order(column, desc=desc)
+            .order(key, desc=desc)
+            .limit(page_size)
+            .execute()).data or []
+
+
+def iter_seek_pages(build_query, column, page_size=PAGE_SIZE, key="id", desc=False, cancelled=None):
+    """Recorre una consulta ordenada por (`column`, `key`) con fetch_seek_page."""
+    after = None
+    while not (cancelled and cancelled()):
+        data = fetch_seek_page(build_query(), column, after, page_size, key, desc)
+        if not data:
+            return
+        yield data
+        if len(data) < page_size:
+            return
+        after = (data[-1].get(column), data[-1][key])
+
+
+def is_missing_column_error(exc):
+    """True si `exc` es el error de PostgREST/Postgres por una columna que no existe."""
+    return getattr(exc, "code", None) in ("42703", "PGRST204")
+
+
+class EmpresasReplica:
+    """
+    Replica local (SQLite) de la tabla `empresas`.
+
+    La primera sincronizacion descarga la tabla completa; las siguientes solo
+    traen filas con `watermark_column` posterior a la ultima vista. Los borrados
+    se detectan comparando conteos y quedan como lapidas (`deleted = 1`).
+    Solo se descargan `columns` (mas id y la marca de agua) y no corre mas de
+    una sincronizacion a la vez.
+    """
+
+    TABLE = "empresas"
+
+    def __init__(self, path, columns, watermark_column="updated_at"):
+        self.path = path
+        self.columns = tuple(col for col in columns if col != "id")
+        self.watermark_column = watermark_column
+        self._delta_supported = True
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._closing = False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function("search_key", 1, search_key, deterministic=True)
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        # Cada columna va con su search_key ya calculado ("<col>_sk") para buscar sin UDF
+        cols = ", ".join(f'"{col}" TEXT, "{col}_sk" TEXT' for col in self.columns)
+        # El propio DDL es la version del esquema: si cambia, la replica se rehace
+        schema = (
+            f"CREATE TABLE {self.TABLE} (id INTEGER PRIMARY KEY, {cols}, "
+            "watermark TEXT, deleted INTEGER NOT NULL DEFAULT 0, nit_canonico TEXT)"
+        )
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            if self._get_meta("schema") == schema:
+                return
+            self._conn.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.execute(schema)
+            self._conn.execute(f"CREATE INDEX {self.TABLE}_nit_canonico ON {self.TABLE} (nit_canonico)")
+            self._set_meta("schema", schema)
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, None if value is None else str(value)),
+        )
+
+    def is_synced(self):
+        with self._lock:
+            return self._get_meta("synced_at") is not None
+
+    def _upsert(self, rows):
+        sk_cols = tuple(f"{col}_sk" for col in self.columns)
+        cols = [f'"{col}"' for col in ("id",) + self.columns + sk_cols + ("watermark", "deleted", "nit_canonico")]
+        placeholders = ", ".join("?" for _ in cols)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in cols[1:])
+        sql = (
+            f"INSERT INTO {self.TABLE} ({', '.join(cols)}) "
+            f"VALUES ({placeholders}) ON CONFLICT(id) DO UPDATE SET {updates}"
+        )
+        self._conn.executemany(sql, [
+            (row["id"],)
+            + tuple(row.get(col) for col in self.columns)
+            + tuple(search_key(row.get(col)) for col in self.columns)
+            + (row.get(self.watermark_column), 0, canonical_nit(row.get("nit_empresa")) or None)
+            for row in rows
+        ])
+
+    def _advance_watermark(self):
+        row = self._conn.execute(
+            f"SELECT watermark, id FROM {self.TABLE} WHERE watermark IS NOT NULL "
+            "ORDER BY watermark DESC, id DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            self._set_meta("watermark", row["watermark"])
+            self._set_meta("watermark_id", row["id"])
+
+    def upsert_rows(self, rows):
+        """Aplica filas escritas localmente sin esperar a la siguiente sincronizacion."""
+        rows = [row for row in rows if row.get("id") is not None]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._upsert(rows)
+
+    def mark_deleted(self, ids):
+        ids = [int(value) for value in ids if value is not None]
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"UPDATE {self.TABLE} SET deleted = 1 WHERE id = ?",
+                [(value,) for value in ids],
+            )
+
+    def close(self):
+        """Cierra la base; si hay una sincronizacion en curso la cierra ella al terminar."""
+        self._closing = True
+        if self._sync_lock.acquire(blocking=False):
+            try:
+                self._close_conn()
+            finally:
+                self._sync_lock.release()
+
+    def _close_conn(self):
+        with self._lock:
+            self._conn.close()
+
+    def sync(self, repo, workers=4, page_size=PAGE_SIZE, cancelled=None, block=True):
+        """
+        Trae a la replica los cambios del repositorio de empresas.
+
+        Args:
+            cancelled: Funcion opcional; si devuelve True se abandona sin escribir
+            block: Si otra sincronizacion esta en curso, esperarla (True) o
+                volver enseguida (False). Sin `block` tampoco se hace la
+                descarga inicial: una busqueda no espera la tabla completa
+
+        Returns:
+            int: Filas insertadas, actualizadas o marcadas como borradas; None
+            si se cancelo o (sin `block`) no se pudo sincronizar en el momento
+        """
+        if not block and not self.is_synced():
+            return None
+        waited = False
+        while not self._sync_lock.acquire(timeout=0.2):
+            if not block or (cancelled and cancelled()):
+                return None
+            waited = True
+        try:
+            if self._closing:
+                return None
+            if waited and self.is_synced():
+                # La sincronizacion que se espero ya dejo la replica al dia
+                return 0
+            if not self.is_synced() or not self._delta_supported:
+                return self._full_pull(repo, workers, page_size, cancelled)
+            try:
+                changes = self._delta_pull(repo, page_size, cancelled)
+            except Exception as exc:
+                if not is_missing_column_error(exc):
+                    raise
+                self._desactivar_delta()
+                return self._full_pull(repo, workers, page_size, cancelled)
+            if changes is None:
+                return None
+            return changes + self._reconcile_deletes(repo, page_size)
+        finally:
+            if self._closing:
+                self._close_conn()
+            self._sync_lock.release()
+
+    def _desactivar_delta(self):
+        self._delta_supported = False
+        LOG.warning(
+            "Sin columna %s en %s: cada sincronizacion de la replica descarga la tabla completa",
+            self.watermark_column,
+            self.TABLE,
+        )
+
+    def _select(self):
+        columns = ("id",) + self.columns
+        if self._delta_supported:
+            columns += (self.watermark_column,)
+        return ",".join(columns)
+
+    def _full_pull(self, repo, workers, page_size, cancelled=None):
+        def pull():
+            _total, pages = repo.scan(self._select(), page_size=page_size, workers=workers, cancelled=cancelled)
+            rows = []
+            for page in pages:
+                rows.extend(page)
+            return rows
+
+        try:
+            rows = pull()
+        except Exception as exc:
+            if not self._delta_supported or not is_missing_column_error(exc):
+                raise
+            self._desactivar_delta()
+            rows = pull()
+        if cancelled and cancelled():
+            return None
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._upsert(rows)
+            self._advance_watermark()
+            self._set_meta("synced_at", time.time())
+        return len(rows)
+
+    def _delta_pull(self, repo, page_size, cancelled=None):
+        with self._lock:
+            value = self._get_meta("watermark")
+            last_id = self._get_meta("watermark_id")
+        after = (value, int(last_id)) if value is not None and last_id is not None else None
+        column = self.watermark_column
+        changes = 0
+        while True:
+            if cancelled and cancelled():
+                return None
+            data = repo.page(self._select(), not_null=(column,), order=(column, True), after=after, limit=page_size)
+            if not data:
+                break
+            with self._lock, self._conn:
+                self._upsert(data)
+            changes += len(data)
+            after = (data[-1][column], data[-1]["id"])
+            if len(data) < page_size:
+                break
+        with self._lock, self._conn:
+            if changes:
+                self._advance_watermark()
+            self._set_meta("synced_at", time.time())
+        return changes
+
+    def _reconcile_deletes(self, repo, page_size):
+        remote = repo.count()
+        with self._lock:
+            local = self._conn.execute(
+                f"SELECT COUNT(*) FROM {self.TABLE} WHERE deleted = 0"
+            ).fetchone()[0]
+        if remote is None or local <= remote:
+            return 0
+        remote_ids = set()
+        for page in repo.iter_pages("id", page_size=page_size):
+            remote_ids.update(row["id"] for row in page)
+        with self._lock:
+            local_ids = [row[0] for row in self._conn.execute(
+                f"SELECT id FROM {self.TABLE} WHERE deleted = 0"
+            )]
+        gone = [value for value in local_ids if value not in remote_ids]
+        self.mark_deleted(gone)
+        return len(gone)
+
+    def query(self, columns, filters=(), search_term="", search_columns=(), order=None):
+        """
+        Lee filas vivas de la replica ordenadas por id o por `order`.
+
+        Args:
+            columns: Columnas a devolver (incluye "id")
+            filters: Pares (columna, valor) que deben coincidir exactamente
+            search_term: Texto a buscar como subcadena (sin distinguir tildes ni mayusculas)
+            search_columns: Columnas donde se busca `search_term`. Si es solo
+                "nit_empresa", primero se busca el NIT canonico exacto por indice
+            order: Tupla opcional (columna, ascendente), desempatada por id
+
+        Returns:
+            list: Diccionarios con las columnas pedidas
+        """
+        where = ["deleted = 0"]
+        params = []
+        for col, value in filters:
+            where.append(f'"{col}" = ?')
+            params.append(value)
+        select = ", ".join(f'"{col}"' for col in columns)
+        order_by = "id"
+        if order and order[0] in self.columns:
+            direction = "ASC NULLS LAST" if order[1] else "DESC NULLS FIRST"
+            order_by = f'"{order[0]}" COLLATE NOCASE {direction}, id {"ASC" if order[1] else "DESC"}'
+
+        def run(extra, extra_params):
+            sql = f"SELECT {select} FROM {self.TABLE} WHERE {' AND '.join(where + extra)} ORDER BY {order_by}"
+            with self._lock:
+                return [dict(row) for row in self._conn.execute(sql, params + extra_params)]
+
+        if not (search_term and search_columns):
+            return run([], [])
+        nit = canonical_nit(search_term) if tuple(search_columns) == ("nit_empresa",) else ""
+        if nit:
+            rows = run(["nit_canonico = ?"], [nit])
+            if rows:
+                return rows
+        conditions = [
+            f'instr("{col}_sk", ?) > 0' if col in self.columns else f'instr(search_key("{col}"), ?) > 0'
+            for col in search_columns
+        ]
+        extra_params = [search_key(search_term)] * len(search_columns)
+        if nit:
+            conditions.append("instr(nit_canonico, ?) > 0")
+            extra_params.append(nit)
+        return run(["(" + " OR ".join(conditions) + ")"], extra_params)
+
+    def distinct_values(self, columns):
+        """Valores distintos (sin vacios) por columna de las filas vivas."""
+        facets = {}
+        with self._lock:
+            for col in columns:
+                rows = self._conn.execute(
+                    f'SELECT DISTINCT trim("{col}") FROM {self.TABLE} '
+                    f'WHERE deleted = 0 AND trim("{col}") <> \'\''
+                )
+                facets[col] = {row[0] for row in rows}
+        return facets
+
+
+def _trigrams(text):
+    return {text[idx:idx + 3] for idx in range(len(text) - 2)}
+
+
+def _row_trigrams(texts):
+    # El separador evita trigramas que crucen columnas validos para una busqueda
+    return _trigrams("\x00".join(texts))
+
+
+class SearchIndex:
+    """
+    Indice invertido de trigramas para busquedas de subcadena en memoria.
+
+    Cada trigrama guarda en un array compacto los ids de las filas que lo
+    contienen en alguna columna. Una busqueda toma la lista del trigrama mas
+    raro del termino y solo verifica esos candidatos contra el texto de las
+    columnas pedidas. Bajas y cambios son perezosos: la verificacion descarta
+    entradas viejas y el indice se reconstruye cuando se acumulan demasiadas.
+
+    Es seguro usarlo desde el hilo de carga y el de la UI a la vez.
+    """
+
+    def __init__(self, columns, key="id"):
+        self.columns = tuple(columns)
+        self.key = key
+        self._positions = {col: idx for idx, col in enumerate(self.columns)}
+        self._texts = {}
+        self._postings = {}
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def normalize(self, value):
+        return search_key(value)
+
+    def clear(self):
+        with self._lock:
+            self._texts = {}
+            self._postings = {}
+            self._stale = 0
+
+    def add(self, rows):
+        """Indexa (o reindexa) filas con al menos `key` y las columnas del indice."""
+        prepared = [
+            (row.get(self.key), tuple(self.normalize(row.get(col)) for col in self.columns))
+            for row in rows
+            if row.get(self.key) is not None
+        ]
+        with self._lock:
+            for row_id, texts in prepared:
+                if row_id in self._texts:
+                    self._stale += 1
+                self._texts[row_id] = texts
+                self._post(row_id, texts)
+            self._maybe_compact()
+
+    def remove(self, row_ids):
+        with self._lock:
+            for row_id in row_ids:
+                if self._texts.pop(row_id, None) is not None:
+                    self._stale += 1
+            self._maybe_compact()
+
+    def _post(self, row_id, texts):
+        postings = self._postings
+        for gram in _row_trigrams(texts):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("q")
+            posting.append(row_id)
+
+    def _maybe_compact(self):
+        if self._stale <= max(1000, len(self._texts)):
+            return
+        self._postings = {}
+        self._stale = 0
+        for row_id, texts in self._texts.items():
+            self._post(row_id, texts)
+
+    def search(self, term, columns=None):
+        """
+        Ids de las filas donde `term` aparece como subcadena.
+
+        Args:
+            term: Texto a buscar (se normaliza igual que las filas)
+            columns: Columnas donde buscar; None para todas
+
+        Returns:
+            set: Ids que coinciden
+        """
+        term = self.normalize(term)
+        positions = [self._positions[col] for col in columns] if columns else range(len(self.columns))
+        with self._lock:
+            texts = self._texts
+            if not term:
+                return set(texts)
+            grams = _trigrams(term)
+            if grams:
+                postings = [self._postings.get(gram) for gram in grams]
+                if any(posting is None for posting in postings):
+                    return set()
+                candidates = min(postings, key=len)
+            else:
+                candidates = texts
+            found = set()
+            for row_id in candidates:
+                row_texts = texts.get(row_id)
+                if row_texts is None or row_id in found:
+                    continue
+                if any(term in row_texts[pos] for pos in positions):
+                    found.add(row_id)
+            return found
+
+
+def fuzzy_key(value):
+    """Clave para comparar nombres con errores: search_key sin puntuacion ("S.A.S" -> "sas")."""
+    text = re.sub(r"[.']", "", search_key(value))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text).split())
+
+
+def _word_trigrams(text):
+    # Como pg_trgm: cada palabra con dos espacios delante y uno detras
+    grams = set()
+    for word in text.split():
+        grams |= _trigrams(f"  {word} ")
+    return frozenset(grams)
+
+
+class FuzzyIndex:
+    """
+    Busqueda aproximada de una columna por similitud de trigramas.
+
+    El puntaje promedia la cobertura del termino (trigramas del termino que
+    aparecen en la fila) y el coeficiente de Dice. Como prefiltro se cuentan
+    en C (Counter) las apariciones de cada fila en las listas del termino y
+    solo se puntuan las que alcanzan la cobertura minima.
+    """
+
+    THRESHOLD = 0.45
+
+    def __init__(self, column, key="id"):
+        self.column = column
+        self.key = key
+        self._grams = {}
+        self._postings = {}
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._grams)
+
+    def clear(self):
+        with self._lock:
+            self._grams = {}
+            self._postings = {}
+            self._stale = 0
+
+    def add(self, rows):
+        prepared = [
+            (row.get(self.key), _word_trigrams(fuzzy_key(row.get(self.column))))
+            for row in rows
+            if row.get(self.key) is not None
+        ]
+        with self._lock:
+            for row_id, grams in prepared:
+                if row_id in self._grams:
+                    self._stale += 1
+                self._grams[row_id] = grams
+                self._post(row_id, grams)
+            self._maybe_compact()
+
+    def remove(self, row_ids):
+        with self._lock:
+            for row_id in row_ids:
+                if self._grams.pop(row_id, None) is not None:
+                    self._stale += 1
+            self._maybe_compact()
+
+    def _post(self, row_id, grams):
+        postings = self._postings
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("q")
+            posting.append(row_id)
+
+    def _maybe_compact(self):
+        if self._stale <= max(1000, len(self._grams)):
+            return
+        self._postings = {}
+        self._stale = 0
+        for row_id, grams in self._grams.items():
+            self._post(row_id, grams)
+
+    def search(self, term, limit=200, threshold=None):
+        """
+        Filas parecidas a `term`, de mayor a menor puntaje.
+
+        Returns:
+            list: Tuplas (id, puntaje entre 0 y 1)
+        """
+        query = _word_trigrams(fuzzy_key(term))
+        total = len(query)
+        if not total:
+            return []
+        threshold = self.THRESHOLD if threshold is None else threshold
+        need = max(1, math.ceil(threshold * total))
+        with self._lock:
+            counts = Counter()
+            for gram in query:
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    counts.update(posting)
+            # Sin entradas viejas el conteo ya es exacto; si no, se verifica
+            exact = self._stale == 0
+            scored = []
+            for row_id, shared in counts.items():
+                if shared < need:
+                    continue
+                grams = self._grams.get(row_id)
+                if grams is None:
+                    continue
+                if not exact:
+                    shared = len(query & grams)
+                    if shared < need:
+                        continue
+                scored.append(((shared / total + 2 * shared / (total + len(grams))) / 2, row_id))
+        best = heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
+        return [(row_id, score) for score, row_id in best]
+
+
+class PrefixIndex:
+    """
+    Sugerencias por prefijo ponderadas por frecuencia.
+
+    Guarda cada valor distinto con su conteo y un arreglo ordenado de claves,
+    una por cada inicio de palabra ("compensar" sugiere "Caja Compensar").
+    El rango de un prefijo se ubica con bisect. Las altas se acumulan y se
+    ordenan juntas en la siguiente consulta, no una vez por pagina.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._display = {}
+        self._entries = []
+        self._pending = []
+        self._dead = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def clear(self):
+        with self._lock:
+            self._counts = Counter()
+            self._display = {}
+            self._entries = []
+            self._pending = []
+            self._dead = 0
+
+    def add(self, values):
+        with self._lock:
+            for value in values:
+                text = " ".join(str(value or "").split())
+                key = search_key(text)
+                if not key:
+                    continue
+                if key not in self._counts:
+                    self._display[key] = text
+                    words = key.split(" ")
+                    for idx in range(len(words)):
+                        self._pending.append((" ".join(words[idx:]), key))
+                self._counts[key] += 1
+
+    def remove(self, values):
+        with self._lock:
+            for value in values:
+                key = search_key(value)
+                if key not in self._counts:
+                    continue
+                self._counts[key] -= 1
+                if self._counts[key] <= 0:
+                    # Sus claves quedan en el arreglo hasta la siguiente compactacion
+                    del self._counts[key]
+                    self._display.pop(key, None)
+                    self._dead += 1
+
+    def _merge(self):
+        if self._dead > max(100, len(self._counts)):
+            self._entries = [entry for entry in self._entries if entry[1] in self._counts]
+            self._dead = 0
+        if self._pending:
+            self._entries.extend(self._pending)
+            self._pending = []
+            self._entries.sort()
+
+    def suggest(self, prefix, limit=10):
+        """
+        Hasta `limit` valores cuyo texto (o alguna de sus palabras) empieza por
+        `prefix`, primero los mas frecuentes.
+        """
+        prefix = search_key(prefix)
+        with self._lock:
+            if not prefix:
+                best = heapq.nsmallest(limit, self._counts, key=lambda key: (-self._counts[key], key))
+                return [self._display[key] for key in best]
+            self._merge()
+            entries = self._entries
+            start = bisect.bisect_left(entries, (prefix,))
+            end = bisect.bisect_left(entries, (prefix + "\U0010ffff",), start)
+            keys = {key for _word, key in entries[start:end] if key in self._counts}
+            best = heapq.nsmallest(limit, keys, key=lambda key: (-self._counts[key], key))
+            return [self._display[key] for key in best]
+
+
+class NitIndex:
+    """
+    Indice hash de NIT canonico a ids de empresa.
+
+    Resuelve en O(1) la busqueda exacta por NIT sin importar puntos, espacios
+    o DV, y detecta duplicados al importar sin recorrer la tabla.
+    """
+
+    def __init__(self, column="nit_empresa", key="id"):
+        self.column = column
+        self.key = key
+        self._ids = {}
+        self._nits = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._nits = {}
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                row_id = row.get(self.key)
+                if row_id is None:
+                    continue
+                self._discard(row_id)
+                nit = canonical_nit(row.get(self.column))
+                if nit:
+                    self._nits[row_id] = nit
+                    self._ids.setdefault(nit, set()).add(row_id)
+
+    def remove(self, ids):
+        with self._lock:
+            for row_id in ids:
+                self._discard(row_id)
+
+    def _discard(self, row_id):
+        nit = self._nits.pop(row_id, None)
+        if nit is None:
+            return
+        ids = self._ids.get(nit)
+        ids.discard(row_id)
+        if not ids:
+            del self._ids[nit]
+
+    def lookup(self, value):
+        """Ids de las empresas con el mismo NIT canonico que `value`."""
+        nit = canonical_nit(value)
+        with self._lock:
+            return set(self._ids.get(nit, ())) if nit else set()
+
+    def containing(self, value):
+        """Ids cuyo NIT canonico contiene los digitos de `value` (recorre los NIT distintos)."""
+        nit = canonical_nit(value)
+        if not nit:
+            return set()
+        with self._lock:
+            found = set()
+            for key, ids in self._ids.items():
+                if nit in key:
+                    found.update(ids)
+            return found
+
+
+class QueryCache:
+    """
+    Cache LRU con vencimiento para resultados de consultas.
+
+    Guarda por clave los ids y las filas del resultado. Se acota por numero de
+    entradas y por total de filas; las entradas vencidas cuentan como fallo.
+    """
+
+    def __init__(self, max_entries=32, ttl=300.0, max_rows=200000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._rows = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Filas guardadas para `key` (copia de la lista) o None."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(entry[2])
+
+    def put(self, key, rows):
+        rows = list(rows)
+        if len(rows) > self.max_rows:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic(), {row.get("id") for row in rows}, rows)
+        self._rows += len(rows)
+        while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, ids=None):
+        """Descarta todo, o solo las entradas que contienen alguno de `ids`."""
+        if ids is None:
+            self._entries.clear()
+            self._rows = 0
+            return
+        ids = set(ids)
+        for key in [key for key, entry in self._entries.items() if not ids.isdisjoint(entry[1])]:
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= len(entry[2])
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        return f"{self.hits} aciertos, {self.misses} fallos ({ratio:.0f}%), {len(self._entries)} entradas"
+
+
+def facets_from_rows(rows, columns):
+    """Valores distintos (sin vacios) por columna calculados sobre filas en memoria."""
+    facets = {col: set() for col in columns}
+    for row in rows:
+        for col, values in facets.items():
+            value = (row.get(col) or "").strip()
+            if value:
+                values.add(value)
+    return facets
+
+
+class FacetProvider:
+    """
+    Opciones de los filtros (valores distintos por columna) con vencimiento.
+
+    El origen se pasa en cada `get` como funcion sin argumentos que devuelve
+    {columna: valores} (un repositorio, la replica o facets_from_rows), porque
+    cambia segun lo que ya este cargado. El resultado se guarda `ttl`
+    segundos; las escrituras locales agregan sus valores nuevos con
+    `add_rows` sin volver a consultar.
+    """
+
+    def __init__(self, columns, ttl=600.0):
+        self.columns = tuple(columns)
+        self.ttl = ttl
+        self._values = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def fresh(self):
+        with self._lock:
+            return self._values is not None and time.monotonic() - self._loaded_at <= self.ttl
+
+    def get(self, source=None):
+        """
+        Opciones ordenadas por columna. Con `source` se consulta si no hay datos
+        vigentes; sin `source` devuelve lo guardado (o None).
+        """
+        if source is not None and not self.fresh():
+            facets = source()
+            with self._lock:
+                self._values = {col: set(facets.get(col, ())) for col in self.columns}
+                self._loaded_at = time.monotonic()
+        with self._lock:
+            if self._values is None:
+                return None
+            return {col: sorted(values, key=search_key) for col, values in self._values.items()}
+
+    def add_rows(self, rows):
+        """Agrega los valores nuevos de `rows`; True si alguno no estaba."""
+        with self._lock:
+            if self._values is None:
+                return False
+            added = False
+            for col, values in facets_from_rows(rows, self.columns).items():
+                new = values - self._values[col]
+                if new:
+                    self._values[col] |= new
+                    added = True
+            return added
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+
+class FacetCounts:
+    """
+    Conteos por valor de las columnas de filtro, cruzados con los demas filtros.
+
+    Cada fila ocupa una posicion y cada (columna, valor) guarda sus posiciones;
+    al consultar se arma (solo para lo que cambio) un bitset como int de Python.
+    El conteo de un valor es el popcount de su bitset AND el de los filtros
+    elegidos en las otras columnas, asi que no se recorren filas. Las mismas
+    posiciones sirven para resolver los filtros en memoria (`matching`).
+    """
+
+    def __init__(self, columns, key="id"):
+        self.columns = tuple(columns)
+        self.key = key
+        self._slots = {}
+        self._ids = []
+        self._values = []
+        self._free = []
+        self._members = {col: {} for col in self.columns}
+        self._bits = {col: {} for col in self.columns}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def clear(self):
+        with self._lock:
+            self._slots = {}
+            self._ids = []
+            self._values = []
+            self._free = []
+            self._members = {col: {} for col in self.columns}
+            self._bits = {col: {} for col in self.columns}
+            self._dirty = set()
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                row_id = row.get(self.key)
+                if row_id is None:
+                    continue
+                self._discard(row_id)
+                values = tuple((row.get(col) or "").strip() for col in self.columns)
+                slot = self._free.pop() if self._free else len(self._values)
+                if slot == len(self._values):
+                    self._values.append(values)
+                    self._ids.append(row_id)
+                else:
+                    self._values[slot] = values
+                    self._ids[slot] = row_id
+                self._slots[row_id] = slot
+                for col, value in zip(self.columns, values):
+                    if value:
+                        self._members[col].setdefault(value, set()).add(slot)
+                        self._dirty.add((col, value))
+
+    def remove(self, ids):
+        with self._lock:
+            for row_id in ids:
+                self._discard(row_id)
+
+    def _discard(self, row_id):
+        slot = self._slots.pop(row_id, None)
+        if slot is None:
+            return
+        for col, value in zip(self.columns, self._values[slot]):
+            members = self._members[col].get(value)
+            if members is None:
+                continue
+            members.discard(slot)
+            self._dirty.add((col, value))
+        self._values[slot] = None
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def _refresh_bits(self):
+        size = (len(self._values) >> 3) + 1
+        for col, value in self._dirty:
+            members = self._members[col].get(value)
+            if not members:
+                self._members[col].pop(value, None)
+                self._bits[col].pop(value, None)
+                continue
+            buffer = bytearray(size)
+            for slot in members:
+                buffer[slot >> 3] |= 1 << (slot & 7)
+            self._bits[col][value] = int.from_bytes(buffer, "little")
+        self._dirty = set()
+
+    def matching(self, selected):
+        """
+        Ids de las filas con todos los valores de `selected` ({columna: valor});
+        None si no hay nada elegido.
+        """
+        selected = [(col, value) for col, value in selected.items() if value]
+        if not selected:
+            return None
+        with self._lock:
+            sets = sorted((self._members[col].get(value, ()) for col, value in selected), key=len)
+            slots = set(sets[0]).intersection(*sets[1:])
+            return {self._ids[slot] for slot in slots}
+
+    def counts(self, selected=None):
+        """
+        {columna: {valor: filas}} para todas las columnas.
+
+        Args:
+            selected: {columna: valor} elegidos; cada columna se cuenta con los
+                filtros de las demas, no con el suyo
+        """
+        selected = {col: value for col, value in (selected or {}).items() if value and col in self._bits}
+        with self._lock:
+            if self._dirty:
+                self._refresh_bits()
+            result = {}
+            for col in self.columns:
+                others = [self._bits[other].get(value, 0) for other, value in selected.items() if other != col]
+                if not others:
+                    result[col] = {value: len(members) for value, members in self._members[col].items()}
+                    continue
+                mask = others[0]
+                for bits in others[1:]:
+                    mask &= bits
+                result[col] = {value: (bits & mask).bit_count() for value, bits in self._bits[col].items()}
+            return result
+
+
+def save_rows_snapshot(path, columns, rows):
+    """
+    Guarda filas como JSON comprimido (gzip) con una fila por lista de valores.
+
+    Args:
+        path: Archivo destino
+        columns: Columnas a guardar, en orden
+        rows: Diccionarios con al menos esas columnas
+    """
+    payload = {
+        "columns": list(columns),
+        "saved_at": time.time(),
+        "rows": [[row.get(col) for col in columns] for row in rows],
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as handler:
+        json.dump(payload, handler, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp_path, path)
+
+
+def load_rows_snapshot(path, columns):
+    """
+    Lee un snapshot de save_rows_snapshot.
+
+    Returns:
+        list: Filas como diccionarios, o [] si no existe o las columnas cambiaron
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handler:
+            payload = json.load(handler)
+    except (OSError, ValueError):
+        LOG.exception("Snapshot ilegible: %s", path)
+        return []
+    if payload.get("columns") != list(columns):
+        return []
+    return [dict(zip(columns, values)) for values in payload.get("rows", [])]
+
+
+def realtime_url(supabase_url, apikey):
+    """
+    URL del websocket de Supabase Realtime.
+
+    RECA_REALTIME_URL la reemplaza, por ejemplo para apuntar a un servidor
+    local de pruebas.
+    """
+    base = os.environ.get("RECA_REALTIME_URL") or (
+        supabase_url.rstrip("/").replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        + "/realtime/v1/websocket"
+    )
+    separator = "&" if "?" in base else "?"
+    return f"{base}{separator}apikey={apikey}&vsn=1.0.0"
+
+
+class RealtimeFeed:
+    """
+    Suscripcion a los cambios de Postgres de una o mas tablas (protocolo Phoenix).
+
+    Corre en un hilo propio y acumula los eventos por (tabla, clave): una rafaga
+    sobre la misma fila queda en su ultimo estado y la UI aplica todo en lote
+    con drain(), en lugar de repintar por evento.
+    """
+
+    HEARTBEAT_S = 25
+    RECONNECT_MAX_S = 30
+
+    def __init__(self, url, tables, access_token=None):
+        """
+        Args:
+            url: URL del websocket (ver realtime_url)
+            tables: Diccionario tabla -> columna clave
+            access_token: JWT de la sesion, necesario si la tabla tiene RLS
+        """
+        self.url = url
+        self.tables = dict(tables)
+        self.access_token = access_token
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ws = None
+        self._ref = 0
+        self._token_dirty = False
+
+    def start(self):
+        """Arranca el hilo; False si falta el paquete websockets."""
+        if _ws_connect is None:
+            LOG.info("Paquete websockets no instalado: cambios en vivo desactivados")
+            return False
+        threading.Thread(target=self._run, daemon=True).start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def set_access_token(self, token):
+        """Actualiza el JWT; el hilo lo reenvia a los canales ya unidos."""
+        self.access_token = token
+        self._token_dirty = True
+
+    def drain(self):
+        """Devuelve y descarta los cambios pendientes como tuplas (tabla, tipo, fila)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.values())
+
+    def _send(self, ws, topic, event, payload, join_ref=None):
+        self._ref += 1
+        ref = str(self._ref)
+        ws.send(json.dumps({
+            "topic": topic,
+            "event": event,
+            "payload": payload,
+            "ref": ref,
+            "join_ref": join_ref or ref,
+        }))
+
+    def _join(self, ws):
+        for table in self.tables:
+            payload = {
+                "config": {
+                    "broadcast": {"self": False},
+                    "presence": {"key": ""},
+                    "postgres_changes": [{"event": "*", "schema": "public", "table": table}],
+                },
+            }
+            if self.access_token:
+                payload["access_token"] = self.access_token
+            self._send(ws, f"realtime:public:{table}", "phx_join", payload)
+
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                with _ws_connect(self.url, open_timeout=10) as ws:
+                    self._ws = ws
+                    self._join(ws)
+                    delay = 1
+                    self._listen(ws)
+            except Exception as exc:
+                if self._stop.is_set():
+                    break
+                LOG.warning("Cambios en vivo desconectados (%s); reintento en %ss", exc, delay)
+            finally:
+                self._ws = None
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, self.RECONNECT_MAX_S)
+
+    def _listen(self, ws):
+        next_beat = time.monotonic() + self.HEARTBEAT_S
+        while not self._stop.is_set():
+            if self._token_dirty:
+                self._token_dirty = False
+                for table in self.tables:
+                    self._send(ws, f"realtime:public:{table}", "access_token", {"access_token": self.access_token})
+            if time.monotonic() >= next_beat:
+                self._send(ws, "phoenix", "heartbeat", {})
+                next_beat = time.monotonic() + self.HEARTBEAT_S
+            try:
+                raw = ws.recv(timeout=max(0.0, next_beat - time.monotonic()))
+            except TimeoutError:
+                continue
+            self._handle(json.loads(raw))
+
+    def _handle(self, message):
+        event = message.get("event")
+        payload = message.get("payload") or {}
+        if event in ("phx_error", "phx_close"):
+            raise ConnectionError(f"canal {message.get('topic')} cerrado por el servidor")
+        if event == "phx_reply" and payload.get("status") not in (None, "ok"):
+            LOG.warning("Realtime rechazo %s: %s", message.get("topic"), payload.get("response"))
+            return
+        if event != "postgres_changes":
+            return
+        data = payload.get("data") or {}
+        table = data.get("table")
+        key = self.tables.get(table)
+        kind = data.get("type")
+        record = data.get("old_record") if kind == "DELETE" else data.get("record")
+        if key is None or not record or record.get(key) is None:
+            return
+        with self._lock:
+            # Reinsertar deja la fila al final: el lote conserva el orden del ultimo cambio
+            self._pending.pop((table, record[key]), None)
+            self._pending[(table, record[key])] = (table, kind, record)
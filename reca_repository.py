@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Repositorios de tablas: la unica puerta de lectura y escritura a los datos.
+
+SupabaseRepository arma las queries de PostgREST. MemoryRepository guarda las
+filas en memoria con la misma interfaz, para pruebas y mediciones sin red.
+
+Las lecturas aceptan los mismos filtros:
+    filters: pares (columna, valor) que deben ser iguales
+    ilike: pares (columna, patron ilike); basta con que coincida uno
+    not_null: columnas que no pueden ser nulas
+    order: tupla opcional (columna, ascendente), desempatada por la clave
+"""
+import re
+import threading
+
+from reca_data import (
+    LOG,
+    PAGE_SIZE,
+    facets_from_rows,
+    fetch_key_bounds,
+    fetch_keyset_page,
+    fetch_seek_page,
+    iter_partitioned_pages,
+    iter_seek_pages,
+)
+
+# Funciones de Postgres que devuelven los valores distintos de una tabla
+FACETS_RPCS = {"empresas": "empresas_facetas"}
+
+WRITE_CHUNK_SIZE = 200
+
+
+class SupabaseRepository:
+    """Operaciones sobre una tabla de Supabase."""
+
+    def __init__(self, client, table, key="id", facets_rpc=None):
+        self.client = client
+        self.table = table
+        self.key = key
+        self.facets_rpc = facets_rpc
+
+    def _query(self, columns="*", filters=(), ilike=(), not_null=(), count=None):
+        query = self.client.table(self.table).select(columns, count=count)
+        for col, value in filters:
+            query = query.eq(col, value)
+        for col in not_null:
+            query = query.not_.is_(col, "null")
+        if len(ilike) == 1:
+            query = query.ilike(*ilike[0])
+        elif ilike:
+            query = query.or_(",".join(f"{col}.ilike.{pattern}" for col, pattern in ilike))
+        return query
+
+    def count(self, filters=(), ilike=(), not_null=(), mode="exact"):
+        """Total de filas que cumplen los filtros (`mode` es el conteo de PostgREST); None si no lo informa."""
+        return self._query(self.key, filters, ilike, not_null, count=mode).limit(1).execute().count
+
+    def page(self, columns="*", filters=(), ilike=(), not_null=(), order=None, after=None,
+             limit=PAGE_SIZE, key=None):
+        """
+        Una pagina por cursor, sin offsets.
+
+        Args:
+            after: Sin `order`, la ultima clave vista; con `order`, la tupla
+                (valor, clave) de la ultima fila. None para la primera pagina
+        """
+        key = key or self.key
+        query = self._query(columns, filters, ilike, not_null)
+        if order is None or tuple(order) == (key, True):
+            return fetch_keyset_page(query, after, limit, key)
+        if order[0] == key and after is not None:
+            after = (after, after)
+        return fetch_seek_page(query, order[0], after, limit, key, desc=not order[1])
+
+    def iter_pages(self, columns="*", filters=(), ilike=(), not_null=(), order=None,
+                   page_size=PAGE_SIZE, key=None, cancelled=None):
+        """Recorre en secuencia todas las paginas de la consulta."""
+        key = key or self.key
+        if order is not None and order[0] != key:
+            yield from iter_seek_pages(
+                lambda: self._query(columns, filters, ilike, not_null),
+                order[0],
+                page_size,
+                key,
+                desc=not order[1],
+                cancelled=cancelled,
+            )
+            return
+        after = None
+        while not (cancelled and cancelled()):
+            data = self.page(columns, filters, ilike, not_null, order, after, page_size, key)
+            if not data:
+                return
+            yield data
+            if len(data) < page_size:
+                return
+            after = data[-1][key]
+
+    def list(self, columns="*", filters=(), ilike=(), not_null=(), order=None, limit=None, key=None):
+        """Todas las filas de la consulta (o las primeras `limit`)."""
+        if limit is not None:
+            return self.page(columns, filters, ilike, not_null, order, None, limit, key)
+        rows = []
+        for data in self.iter_pages(columns, filters, ilike, not_null, order, key=key):
+            rows.extend(data)
+        return rows
+
+    def scan(self, columns="*", filters=(), ilike=(), order=None, page_size=PAGE_SIZE, workers=1,
+             count="exact", cancelled=None):
+        """
+        Lectura completa para la carga de la grilla.
+
+        Sin `order` reparte el rango de la clave entre `workers` peticiones en
+        paralelo; con `order` pagina en secuencia sobre (columna, clave).
+
+        Returns:
+            tuple: (total, iterador de paginas)
+        """
+        def build(cols, count=None):
+            return self._query(cols, filters, ilike, count=count)
+
+        if order is not None:
+            total = self.count(filters, ilike, mode=count)
+            return total, self.iter_pages(columns, filters, ilike, order=order, page_size=page_size,
+                                          cancelled=cancelled)
+        total, low, high = fetch_key_bounds(build, self.key, count)
+        if not total:
+            return 0, iter(())
+        return total, iter_partitioned_pages(
+            build,
+            columns,
+            total,
+            low,
+            high,
+            workers=workers,
+            page_size=page_size,
+            key=self.key,
+            cancelled=cancelled,
+        )
+
+    def get(self, value, columns="*", key=None):
+        """La fila con `key` igual a `value`, o None."""
+        data = self.page(columns, [(key or self.key, value)], limit=1)
+        return data[0] if data else None
+
+    def insert_many(self, rows, chunk_size=WRITE_CHUNK_SIZE):
+        """Inserta por tandas y devuelve las filas creadas."""
+        rows = list(rows)
+        created = []
+        for idx in range(0, len(rows), chunk_size):
+            created.extend(self.client.table(self.table).insert(rows[idx:idx + chunk_size]).execute().data or [])
+        return created
+
+    def update_many(self, changes, key=None):
+        """Aplica pares (valor de la clave, cambios) y devuelve las filas actualizadas."""
+        key = key or self.key
+        updated = []
+        for value, payload in changes:
+            updated.extend(self.client.table(self.table).update(payload).eq(key, value).execute().data or [])
+        return updated
+
+    def delete_many(self, values, key=None, chunk_size=WRITE_CHUNK_SIZE):
+        key = key or self.key
+        values = list(values)
+        for idx in range(0, len(values), chunk_size):
+            self.client.table(self.table).delete().in_(key, values[idx:idx + chunk_size]).execute()
+
+    def insert(self, row):
+        created = self.insert_many([row])
+        return created[0] if created else None
+
+    def update(self, value, payload, key=None):
+        updated = self.update_many([(value, payload)], key)
+        return updated[0] if updated else None
+
+    def delete(self, value, key=None):
+        self.delete_many([value], key)
+
+    def distinct(self, columns):
+        """
+        Valores distintos (sin vacios) por columna: {columna: set}.
+
+        Con `facets_rpc` es una sola llamada; la funcion devuelve filas
+        (columna, valor) y en Postgres basta con:
+
+            create function empresas_facetas(columnas text[])
+            returns table (columna text, valor text) language sql stable as $$
+              select c.col, v.valor
+              from unnest(columnas) as c(col),
+                   lateral (select distinct to_jsonb(e) ->> c.col as valor from empresas e) v
+              where nullif(trim(v.valor), '') is not null
+            $$;
+
+        Sin la funcion se recorre la tabla por paginas con solo esas columnas.
+        """
+        columns = tuple(columns)
+        if self.facets_rpc:
+            try:
+                data = self.rpc(self.facets_rpc, {"columnas": list(columns)}) or []
+            except Exception:
+                LOG.warning("RPC %s no disponible; los valores se leen de la tabla", self.facets_rpc, exc_info=True)
+            else:
+                facets = {col: set() for col in columns}
+                for row in data:
+                    values = facets.get(row.get("columna"))
+                    value = (row.get("valor") or "").strip()
+                    if values is not None and value:
+                        values.add(value)
+                return facets
+        return facets_from_rows(self.list(",".join((self.key,) + columns)), columns)
+
+    def rpc(self, name, params=None):
+        """Llama una funcion de Postgres y devuelve su resultado."""
+        return self.client.rpc(name, params or {}).execute().data
+
+
+def _ilike_regex(pattern):
+    # % y * son comodin libre, _ un caracter; el resto es literal
+    parts = []
+    for ch in pattern:
+        if ch in "%*":
+            parts.append(".*")
+        elif ch == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _project(row, columns):
+    if columns == "*":
+        return dict(row)
+    return {col: row.get(col) for col in (part.strip() for part in columns.split(",")) if col}
+
+
+class MemoryRepository:
+    """
+    Tabla en memoria con la interfaz de SupabaseRepository.
+
+    Sirve para pruebas y mediciones sin red. Con clave "id" las filas nuevas
+    reciben un id incremental. Las funciones de `rpcs` ({nombre: funcion(params)})
+    reemplazan a las de Postgres.
+    """
+
+    def __init__(self, table, rows=(), key="id", rpcs=None):
+        self.table = table
+        self.key = key
+        self.rpcs = dict(rpcs or {})
+        self._rows = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.insert_many(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _select(self, filters=(), ilike=(), not_null=(), order=None, key=None):
+        key = key or self.key
+        patterns = [(col, _ilike_regex(pattern)) for col, pattern in ilike]
+        with self._lock:
+            rows = [
+                row for row in self._rows
+                if all(row.get(col) == value for col, value in filters)
+                and all(row.get(col) is not None for col in not_null)
+                and (not patterns or any(
+                    regex.fullmatch(str(row.get(col))) for col, regex in patterns if row.get(col) is not None
+                ))
+            ]
+        column, ascending = order or (key, True)
+        # Como Postgres: nulos al final en ascendente y al inicio en descendente
+        rows.sort(key=lambda row: row.get(key))
+        rows.sort(key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else ""))
+        if not ascending:
+            rows.reverse()
+        return rows, column, ascending
+
+    def count(self, filters=(), ilike=(), not_null=(), mode="exact"):
+        return len(self._select(filters, ilike, not_null)[0])
+
+    def page(self, columns="*", filters=(), ilike=(), not_null=(), order=None, after=None,
+             limit=PAGE_SIZE, key=None):
+        key = key or self.key
+        rows, column, ascending = self._select(filters, ilike, not_null, order, key)
+        if after is not None:
+            if column == key and not isinstance(after, tuple):
+                after = (after, after)
+            marker = (after[0] is None, after[0] if after[0] is not None else "", after[1])
+
+            def position(row):
+                value = row.get(column)
+                return (value is None, value if value is not None else "", row.get(key))
+
+            rows = [row for row in rows if (position(row) > marker if ascending else position(row) < marker)]
+        return [_project(row, columns) for row in rows[:limit]]
+
+    def iter_pages(self, columns="*", filters=(), ilike=(), not_null=(), order=None,
+                   page_size=PAGE_SIZE, key=None, cancelled=None):
+        key = key or self.key
+        column = order[0] if order else key
+        after = None
+        while not (cancelled and cancelled()):
+            data = self.page("*", filters, ilike, not_null, order, after, page_size, key)
+            if not data:
+                return
+            after = (data[-1].get(column), data[-1][key])
+            yield [_project(row, columns) for row in data]
+            if len(data) < page_size:
+                return
+
+    def list(self, columns="*", filters=(), ilike=(), not_null=(), order=None, limit=None, key=None):
+        rows = self._select(filters, ilike, not_null, order, key)[0]
+        if limit is not None:
+            rows = rows[:limit]
+        return [_project(row, columns) for row in rows]
+
+    def scan(self, columns="*", filters=(), ilike=(), order=None, page_size=PAGE_SIZE, workers=1,
+             count="exact", cancelled=None):
+        total = self.count(filters, ilike)
+        return total, self.iter_pages(columns, filters, ilike, order=order, page_size=page_size,
+                                      cancelled=cancelled)
+
+    def get(self, value, columns="*", key=None):
+        key = key or self.key
+        with self._lock:
+            row = next((row for row in self._rows if row.get(key) == value), None)
+        return _project(row, columns) if row is not None else None
+
+    def insert_many(self, rows, chunk_size=WRITE_CHUNK_SIZE):
+        created = []
+        with self._lock:
+            for row in rows:
+                row = dict(row)
+                if self.key == "id":
+                    if row.get("id") is None:
+                        row["id"] = self._next_id
+                    self._next_id = max(self._next_id, row["id"] + 1)
+                self._rows.append(row)
+                created.append(dict(row))
+        return created
+
+    def update_many(self, changes, key=None):
+        key = key or self.key
+        updated = []
+        with self._lock:
+            for value, payload in changes:
+                for row in self._rows:
+                    if row.get(key) == value:
+                        row.update(payload)
+                        updated.append(dict(row))
+        return updated
+
+    def delete_many(self, values, key=None, chunk_size=WRITE_CHUNK_SIZE):
+        key = key or self.key
+        values = set(values)
+        with self._lock:
+            self._rows = [row for row in self._rows if row.get(key) not in values]
+
+    def insert(self, row):
+        return self.insert_many([row])[0]
+
+    def update(self, value, payload, key=None):
+        updated = self.update_many([(value, payload)], key)
+        return updated[0] if updated else None
+
+    def delete(self, value, key=None):
+        self.delete_many([value], key)
+
+    def distinct(self, columns):
+        return facets_from_rows(self.list(), tuple(columns))
+
+    def rpc(self, name, params=None):
+        return self.rpcs[name](params or {})
+
+
+class Repositories:
+    """Un repositorio por tabla, creado con `factory(tabla)` la primera vez que se pide."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, table):
+        with self._lock:
+            repo = self._repos.get(table)
+            if repo is None:
+                repo = self._repos[table] = self._factory(table)
+            return repo
+
+    @classmethod
+    def supabase(cls, client):
+        return cls(lambda table: SupabaseRepository(client, table, facets_rpc=FACETS_RPCS.get(table)))
+
+    @classmethod
+    def memory(cls, tables=None):
+        """Repositorios en memoria; `tables` da las filas iniciales por tabla."""
+        tables = tables or {}
+        return cls(lambda table: MemoryRepository(table, tables.get(table, ())))
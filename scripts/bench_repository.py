@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reca_repository import MemoryRepository, SupabaseRepository
+
+CIUDADES = ("Bogota", "Soacha", "Chia", "Cajica", "Zipaquira", None)
+
+
+def synthetic_rows(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "nombre_empresa": f"Empresa {rng.randrange(count // 3 or 1):05d}",
+            "ciudad_empresa": rng.choice(CIUDADES),
+            "estado": rng.choice(("Activa", "Inactiva")),
+        }
+        for _ in range(count)
+    ]
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label}= {(time.perf_counter() - started) * 1000:.1f} ms")
+    return result
+
+
+def check(label, ids, expected):
+    if len(ids) != len(set(ids)):
+        raise SystemExit(f"{label}: filas repetidas")
+    if set(ids) != expected:
+        raise SystemExit(f"{label}: {len(expected - set(ids))} filas faltantes")
+
+
+def ordered(rows, column, ascending):
+    """Comprueba el orden (columna, id) con nulos al final en ascendente."""
+    keys = [(row.get(column) is None, row.get(column) or "", row["id"]) for row in rows]
+    return keys == sorted(keys, reverse=not ascending)
+
+
+def run(repo, page_size, workers):
+    filters = [("estado", "Activa")]
+    expected = {row["id"] for page in repo.iter_pages("id", page_size=page_size) for row in page}
+    activas = {row["id"] for page in repo.iter_pages("id", filters, page_size=page_size) for row in page}
+    print("rows=", len(expected))
+
+    pages = timed("keyset_pages", lambda: list(repo.iter_pages("id", page_size=page_size)))
+    check("keyset", [row["id"] for page in pages for row in page], expected)
+
+    for order in (("nombre_empresa", True), ("ciudad_empresa", False)):
+        columns = f"id,{order[0]}"
+        pages = timed(f"seek_pages[{order[0]}]", lambda: list(
+            repo.iter_pages(columns, order=order, page_size=page_size)
+        ))
+        rows = [row for page in pages for row in page]
+        check(f"seek {order[0]}", [row["id"] for row in rows], expected)
+        if not ordered(rows, *order):
+            raise SystemExit(f"seek {order[0]}: orden incorrecto")
+
+    total, pages = repo.scan("id,estado", filters, page_size=page_size, workers=workers)
+    rows = timed("scan", lambda: [row for page in pages for row in page])
+    check("scan", [row["id"] for row in rows], activas)
+    if total is not None and total != len(activas):
+        raise SystemExit(f"scan: total {total} != {len(activas)}")
+    print("result=ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time repository paging, seek and scan paths.")
+    parser.add_argument("--rows", type=int, default=5000, help="Synthetic rows for the in-memory backend")
+    parser.add_argument("--page-size", type=int, default=500, help="Page size")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel workers for scan")
+    parser.add_argument("--supabase", action="store_true", help="Run read-only against the empresas table")
+    args = parser.parse_args()
+
+    if args.supabase:
+        from dotenv import load_dotenv
+        from supabase import create_client
+
+        load_dotenv(".env")
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            raise RuntimeError("Missing SUPABASE_URL/SUPABASE_KEY")
+        repo = SupabaseRepository(create_client(url, key), "empresas")
+    else:
+        repo = MemoryRepository("empresas", synthetic_rows(args.rows))
+    run(repo, args.page_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,17 @@ import argparse
 import csv
 import os
 import re
+import sys
 import unicodedata
 from collections import defaultdict
 
 from dotenv import load_dotenv
 from supabase import create_client
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reca_data import canonical_nit, nit_dv_ok
+from reca_repository import SupabaseRepository
+
 
 EXPECTED_HEADERS = [
     "NOMBRE",
@@ -56,16 +61,6 @@ def normalize_name(value):
     return text.lower() if text else ""
 
 
-def normalize_nit(value):
-    text = clean_text(value)
-    if not text:
-        return ""
-    text = text.replace(" ", "")
-    if re.fullmatch(r"\d+\.0+", text):
-        text = text.split(".", 1)[0]
-    return text.lower()
-
-
 def read_csv_rows(path):
     for enc in ("utf-8-sig", "utf-8", "latin-1"):
         try:
@@ -107,24 +102,11 @@ def map_row(row):
     }
 
 
-def fetch_existing_pairs(client):
+def fetch_existing_pairs(empresas):
     pairs = set()
-    offset = 0
-    batch = 1000
-    while True:
-        data = (
-            client.table("empresas")
-            .select("nit_empresa,nombre_empresa")
-            .range(offset, offset + batch - 1)
-            .execute()
-            .data
-            or []
-        )
+    for data in empresas.iter_pages("id,nit_empresa,nombre_empresa"):
         for rec in data:
-            pairs.add((normalize_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa"))))
-        if len(data) < batch:
-            break
-        offset += batch
+            pairs.add((canonical_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa"))))
     return pairs
 
 
@@ -139,7 +121,7 @@ def main():
     key = os.getenv("SUPABASE_KEY")
     if not url or not key:
         raise RuntimeError("Faltan SUPABASE_URL o SUPABASE_KEY en .env")
-    client = create_client(url, key)
+    empresas = SupabaseRepository(create_client(url, key), "empresas")
 
     headers, raw_rows, encoding = read_csv_rows(args.csv)
     if len(headers) != len(EXPECTED_HEADERS):
@@ -153,7 +135,7 @@ def main():
         if any(v for v in rec.values()):
             mapped.append(rec)
 
-    existing_pairs = fetch_existing_pairs(client)
+    existing_pairs = fetch_existing_pairs(empresas)
 
     csv_pair_seen = set()
     csv_pair_dupes = 0
@@ -162,7 +144,7 @@ def main():
     skipped_no_key = 0
 
     for rec in mapped:
-        key_pair = (normalize_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa")))
+        key_pair = (canonical_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa")))
         if not key_pair[0] and not key_pair[1]:
             skipped_no_key += 1
             continue
@@ -178,11 +160,12 @@ def main():
     # Report how many NITs have more than one distinct name in the new batch.
     nit_names = defaultdict(set)
     for rec in to_insert:
-        nit_key = normalize_nit(rec.get("nit_empresa"))
+        nit_key = canonical_nit(rec.get("nit_empresa"))
         name_key = normalize_name(rec.get("nombre_empresa"))
         if nit_key and name_key:
             nit_names[nit_key].add(name_key)
     repeated_nit_diff_name = sum(1 for names in nit_names.values() if len(names) > 1)
+    invalid_dv = sum(1 for rec in to_insert if not nit_dv_ok(rec.get("nit_empresa")))
 
     print(f"encoding={encoding}")
     print(f"rows_csv={len(raw_rows)}")
@@ -192,6 +175,7 @@ def main():
     print(f"skipped_no_key={skipped_no_key}")
     print(f"to_insert={len(to_insert)}")
     print(f"nits_with_multiple_names_in_new_rows={repeated_nit_diff_name}")
+    print(f"nits_with_invalid_dv_in_new_rows={invalid_dv}")
 
     if not args.apply:
         print("mode=dry_run")
@@ -201,14 +185,8 @@ def main():
         print("applied_inserts=0")
         return
 
-    inserted = 0
-    chunk_size = 200
-    for idx in range(0, len(to_insert), chunk_size):
-        chunk = to_insert[idx : idx + chunk_size]
-        client.table("empresas").insert(chunk).execute()
-        inserted += len(chunk)
-
-    print(f"applied_inserts={inserted}")
+    empresas.insert_many(to_insert, chunk_size=200)
+    print(f"applied_inserts={len(to_insert)}")
 
 
 if __name__ == "__main__":
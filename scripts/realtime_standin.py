@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from websockets.sync.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reca_data import RealtimeFeed
+
+
+class StandinServer:
+    """Servidor websocket minimo que imita a Supabase Realtime (protocolo Phoenix)."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._server = serve(self._handler, host, port)
+        self.port = self._server.socket.getsockname()[1]
+
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/realtime/v1/websocket"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+
+    def clients(self):
+        with self._lock:
+            return len(self._clients)
+
+    def _handler(self, ws):
+        with self._lock:
+            self._clients.add(ws)
+        try:
+            for raw in ws:
+                message = json.loads(raw)
+                # Joins, heartbeats y renovaciones de token solo esperan un ok
+                ws.send(json.dumps({
+                    "topic": message.get("topic"),
+                    "event": "phx_reply",
+                    "payload": {"status": "ok", "response": {}},
+                    "ref": message.get("ref"),
+                }))
+        finally:
+            with self._lock:
+                self._clients.discard(ws)
+
+    def emit(self, table, kind, record):
+        """Envia un postgres_changes a todos los clientes conectados."""
+        message = json.dumps({
+            "topic": f"realtime:public:{table}",
+            "event": "postgres_changes",
+            "payload": {"data": {
+                "table": table,
+                "type": kind,
+                "record": record if kind != "DELETE" else {},
+                "old_record": record if kind == "DELETE" else {},
+            }},
+            "ref": None,
+        })
+        with self._lock:
+            clients = list(self._clients)
+        for ws in clients:
+            ws.send(message)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.05)
+    return None
+
+
+def smoke(server):
+    """Suscribe un RealtimeFeed al servidor y comprueba que llegan cambios por clave."""
+    feed = RealtimeFeed(server.url() + "?apikey=local&vsn=1.0.0", {"asesores": "nombre", "empresas": "id"})
+    if not feed.start():
+        print("smoke=skipped (websockets no instalado)")
+        return 1
+    try:
+        if not wait_for(server.clients):
+            print("smoke=failed (el feed no se conecto)")
+            return 1
+        time.sleep(0.2)
+        server.emit("asesores", "INSERT", {"nombre": "Ana", "email": "ana@example.com"})
+        server.emit("asesores", "UPDATE", {"nombre": "Ana", "email": "ana@reca.co"})
+        server.emit("empresas", "DELETE", {"id": 7})
+        server.emit("asesores", "INSERT", {"email": "sin_clave@example.com"})
+        pending = []
+        wait_for(lambda: pending.extend(feed.drain()) or len(pending) >= 2)
+        expected = [
+            ("asesores", "UPDATE", {"nombre": "Ana", "email": "ana@reca.co"}),
+            ("empresas", "DELETE", {"id": 7}),
+        ]
+        if pending != expected:
+            print("smoke=failed", pending)
+            return 1
+        print("smoke=ok")
+        return 0
+    finally:
+        feed.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for Supabase Realtime (use with RECA_REALTIME_URL).")
+    parser.add_argument("--port", type=int, default=4000, help="Port to listen on")
+    parser.add_argument("--smoke", action="store_true", help="Run a RealtimeFeed round trip and exit")
+    args = parser.parse_args()
+
+    server = StandinServer(port=0 if args.smoke else args.port)
+    server.start()
+    try:
+        if args.smoke:
+            sys.exit(smoke(server))
+        print(f"RECA_REALTIME_URL={server.url()}")
+        print('Events on stdin: <INSERT|UPDATE|DELETE> <table> <json record>, e.g. UPDATE asesores {"nombre": "Ana"}')
+        for line in sys.stdin:
+            parts = line.strip().split(" ", 2)
+            if len(parts) != 3:
+                continue
+            kind, table, record = parts
+            server.emit(table, kind.upper(), json.loads(record))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import argparse
 import json
 import os
 import re
+import sys
 import unicodedata
 from collections import defaultdict
 from datetime import datetime
@@ -10,6 +11,10 @@ from dotenv import load_dotenv
 from openpyxl import load_workbook
 from supabase import create_client
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reca_data import canonical_nit
+from reca_repository import SupabaseRepository
+
 
 def to_text(value):
     if value is None:
@@ -35,17 +40,6 @@ def normalize_spaces(text):
     return re.sub(r"\s+", " ", text).strip()
 
 
-def normalize_nit(value):
-    text = to_text(value)
-    if not text:
-        return ""
-    text = strip_invisible_chars(text)
-    text = text.replace(" ", "")
-    if re.fullmatch(r"\d+\.0+", text):
-        text = text.split(".", 1)[0]
-    return text.lower()
-
-
 def normalize_name(value):
     text = normalize_spaces(to_text(value))
     return text.lower() if text else ""
@@ -93,37 +87,21 @@ def load_sheet(path):
     return ws.title, records
 
 
-def fetch_db_rows(client):
-    rows = []
-    offset = 0
-    batch = 1000
-    while True:
-        data = (
-            client.table("empresas")
-            .select("id,nit_empresa,nombre_empresa")
-            .range(offset, offset + batch - 1)
-            .execute()
-            .data
-            or []
-        )
-        rows.extend(data)
-        if len(data) < batch:
-            break
-        offset += batch
-    return rows
+def fetch_db_rows(empresas):
+    return empresas.list("id,nit_empresa,nombre_empresa")
 
 
 def build_plan(sheet_rows, db_rows):
     sheet_by_pair = {}
     for rec in sheet_rows:
-        key = (normalize_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa")))
+        key = (canonical_nit(rec.get("nit_empresa")), normalize_name(rec.get("nombre_empresa")))
         if not key[0] and not key[1]:
             continue
         sheet_by_pair[key] = rec
 
     db_by_pair = defaultdict(list)
     for row in db_rows:
-        key = (normalize_nit(row.get("nit_empresa")), normalize_name(row.get("nombre_empresa")))
+        key = (canonical_nit(row.get("nit_empresa")), normalize_name(row.get("nombre_empresa")))
         db_by_pair[key].append(row)
 
     update_ops = []
@@ -139,17 +117,9 @@ def build_plan(sheet_rows, db_rows):
     return sheet_by_pair, db_by_pair, update_ops, insert_ops
 
 
-def backup_current_table(client, output_dir):
+def backup_current_table(empresas, output_dir):
     os.makedirs(output_dir, exist_ok=True)
-    all_rows = []
-    offset = 0
-    batch = 1000
-    while True:
-        data = client.table("empresas").select("*").range(offset, offset + batch - 1).execute().data or []
-        all_rows.extend(data)
-        if len(data) < batch:
-            break
-        offset += batch
+    all_rows = empresas.list("*")
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     path = os.path.join(output_dir, f"empresas_backup_{ts}.json")
@@ -158,21 +128,10 @@ def backup_current_table(client, output_dir):
     return path, len(all_rows)
 
 
-def apply_changes(client, update_ops, insert_ops):
-    updated = 0
-    inserted = 0
-
-    for row_id, payload in update_ops:
-        client.table("empresas").update(payload).eq("id", row_id).execute()
-        updated += 1
-
-    chunk_size = 200
-    for i in range(0, len(insert_ops), chunk_size):
-        chunk = insert_ops[i : i + chunk_size]
-        client.table("empresas").insert(chunk).execute()
-        inserted += len(chunk)
-
-    return updated, inserted
+def apply_changes(empresas, update_ops, insert_ops):
+    empresas.update_many(update_ops)
+    empresas.insert_many(insert_ops, chunk_size=200)
+    return len(update_ops), len(insert_ops)
 
 
 def main():
@@ -188,10 +147,10 @@ def main():
     if not url or not key:
         raise RuntimeError("Missing SUPABASE_URL/SUPABASE_KEY")
 
-    client = create_client(url, key)
+    empresas = SupabaseRepository(create_client(url, key), "empresas")
 
     sheet_name, sheet_rows = load_sheet(args.excel)
-    db_rows = fetch_db_rows(client)
+    db_rows = fetch_db_rows(empresas)
     sheet_by_pair, db_by_pair, update_ops, insert_ops = build_plan(sheet_rows, db_rows)
 
     duplicate_db_pairs = sum(1 for key in sheet_by_pair if len(db_by_pair.get(key, [])) > 1)
@@ -214,11 +173,11 @@ def main():
         print("mode=dry_run")
         return
 
-    backup_path, backup_rows = backup_current_table(client, args.backup_dir)
+    backup_path, backup_rows = backup_current_table(empresas, args.backup_dir)
     print("backup_path=", backup_path)
     print("backup_rows=", backup_rows)
 
-    updated, inserted = apply_changes(client, update_ops, insert_ops)
+    updated, inserted = apply_changes(empresas, update_ops, insert_ops)
     print("applied_updates=", updated)
     print("applied_inserts=", inserted)
 